@@ -0,0 +1,195 @@
+#
+# The MIT License
+#
+# Copyright 2026 Vector Informatik, GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+# bitbucket_upload.py - Bitbucket Code Insights report/annotation uploads
+#
+# All requests go through one requests.Session so the HTTPS connections are
+# reused.  Annotation batches are posted from a small thread pool, throttled by
+# a request rate limiter and retried with backoff on 429 and 5xx responses.
+
+from __future__ import print_function
+
+import os
+import time
+import threading
+import itertools
+import collections
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # python 2 without the futures backport - batches are posted one at a time
+    ThreadPoolExecutor = None
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# the API can be pointed at a local stand-in server for testing
+API_URL = os.environ.get("BITBUCKET_API_URL", "https://api.bitbucket.org/2.0")
+
+# Bitbucket accepts at most 100 annotations per request
+BATCH_SIZE = 100
+UPLOAD_JOBS = 4
+REQUESTS_PER_SECOND = 10.0
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30.0
+TIMEOUT_SECONDS = 30
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+def report_url(workspace, repo_slug, commit_hash, report_id):
+    return "{}/repositories/{}/{}/commit/{}/reports/{}".format(API_URL, workspace, repo_slug, commit_hash, report_id)
+
+def make_session(email, token, pool_size = UPLOAD_JOBS):
+    session = requests.Session()
+    session.auth = (email, token)
+    session.headers.update({"Accept": "application/json", "Content-Type": "application/json"})
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+class RateLimiter(object):
+    """Spaces out requests from all threads to at most rate per second"""
+    def __init__(self, rate = REQUESTS_PER_SECOND):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.time()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+def retry_delay(resp, attempt, backoff = BACKOFF_SECONDS):
+    """Seconds to wait before retrying - Retry-After if the server sent one"""
+    try:
+        delay = float(resp.headers.get("Retry-After", ""))
+    except (AttributeError, ValueError):
+        delay = backoff * (2 ** attempt)
+    return min(delay, MAX_BACKOFF_SECONDS)
+
+def send_with_retry(session, method, url, limiter = None, retries = MAX_RETRIES, backoff = BACKOFF_SECONDS, **kwargs):
+    """
+    Sends the request, retrying 429/5xx responses and connection errors.
+    Returns (response, attempts).  The last response is returned if all the
+    retries failed and the last exception is raised if no response came back.
+    """
+    kwargs.setdefault("timeout", TIMEOUT_SECONDS)
+    attempt = 0
+    while True:
+        if limiter:
+            limiter.wait()
+        try:
+            resp = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= retries:
+                raise
+            resp = None
+        else:
+            if resp.status_code not in RETRY_STATUS or attempt >= retries:
+                return resp, attempt + 1
+
+        time.sleep(retry_delay(resp, attempt, backoff))
+        attempt += 1
+
+class BatchResult(object):
+    def __init__(self, number, size, status_code, text, latency, attempts):
+        self.number = number
+        self.size = size
+        self.status_code = status_code
+        self.text = text
+        self.latency = latency
+        self.attempts = attempts
+
+    @property
+    def ok(self):
+        return self.status_code == 200
+
+def post_batch(session, url, number, batch, limiter, retries, backoff):
+    start = time.time()
+    try:
+        resp, attempts = send_with_retry(session, "POST", url, limiter, retries, backoff, json=batch)
+        status_code, text = resp.status_code, resp.text
+    except requests.RequestException as e:
+        status_code, text, attempts = None, str(e), retries + 1
+    return BatchResult(number, len(batch), status_code, text, time.time() - start, attempts)
+
+def iter_batches(items, batch_size = BATCH_SIZE):
+    """Lists of up to batch_size items, read from any iterable as they are needed"""
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def upload_annotations(session, url, annotations, jobs = UPLOAD_JOBS, rate = REQUESTS_PER_SECOND,
+                       batch_size = BATCH_SIZE, retries = MAX_RETRIES, backoff = BACKOFF_SECONDS, verbose = False):
+    """
+    POSTs annotations (any iterable) to url in batches, up to jobs batches at
+    a time.  Only the batches in flight are held in memory.  Prints each
+    batch's status and latency as it completes, then the overall throughput,
+    and returns the BatchResult list in batch order.
+    """
+    jobs = max(1, jobs)
+    limiter = RateLimiter(rate)
+    start = time.time()
+
+    def report(result):
+        retried = " after {} attempts".format(result.attempts) if result.attempts > 1 else ""
+        if not result.ok or verbose:
+            print("Batch {} response: {} {} ({:.2f}s{})".format(result.number, result.status_code, result.text, result.latency, retried))
+        else:
+            print("Batch {} response: {} ({:.2f}s{})".format(result.number, result.status_code, result.latency, retried))
+        results.append(result)
+
+    results = []
+    if ThreadPoolExecutor is None or jobs == 1:
+        for number, batch in enumerate(iter_batches(annotations, batch_size), start=1):
+            report(post_batch(session, url, number, batch, limiter, retries, backoff))
+    else:
+        pending = collections.deque()
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for number, batch in enumerate(iter_batches(annotations, batch_size), start=1):
+                if len(pending) >= 2 * jobs:
+                    report(pending.popleft().result())
+                pending.append(executor.submit(post_batch, session, url, number, batch, limiter, retries, backoff))
+            while pending:
+                report(pending.popleft().result())
+
+    elapsed = time.time() - start
+    total = sum(result.size for result in results)
+    sent = sum(result.size for result in results if result.ok)
+    failed = sum(1 for result in results if not result.ok)
+    print("Sent {} of {} annotations in {} batches ({} failed) in {:.2f}s - {:.1f} annotations/s".format(
+        sent, total, len(results), failed, elapsed, sent / elapsed if elapsed > 0 else 0.0))
+
+    return results
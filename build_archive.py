@@ -0,0 +1,384 @@
+#
+# The MIT License
+#
+# Copyright 2026 Vector Informatik, GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+# build_archive.py - build directory archives shared by copy_build_dir and extract_build_dir
+
+from __future__ import print_function
+
+import os
+import io
+import json
+import shutil
+import hashlib
+import tarfile
+import tempfile
+
+from vcast_utils import replaceFile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# archive member holding the build manifest - never extracted to disk
+MANIFEST_NAME = "build_manifest.json"
+MANIFEST_VERSION = 1
+
+ARCHIVE_SUFFIX = "_build.tar"
+COMPRESS_EXTENSIONS = {
+    "none" : "",
+    "zstd" : ".zst",
+    "gz"   : ".gz",
+    "xz"   : ".xz",
+}
+COMPRESS_CHOICES = ["none", "auto", "zstd", "gz", "xz"]
+
+ZSTD_LEVEL = 3
+HASH_CHUNK_SIZE = 1024 * 1024
+SPOOL_MAX_SIZE = 64 * 1024 * 1024
+
+# written next to the environment's build directory, so every archive of a
+# project has its own copy of these
+SHARED_FILES = ["CCAST_.CFG", "vcast_manage.cfg"]
+
+class NoLock(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+def isSharedFile(name):
+    return os.path.basename(name) in SHARED_FILES
+
+def resolveCompression(compress):
+    """Map the requested compression onto what is available here"""
+    if compress == "auto":
+        compress = "zstd" if zstandard else "gz"
+    if compress == "zstd" and zstandard is None:
+        print("  zstandard module not available...using gzip compression")
+        compress = "gz"
+    return compress
+
+def archiveName(basename, compress = "none"):
+    return basename + ARCHIVE_SUFFIX + COMPRESS_EXTENSIONS[resolveCompression(compress)]
+
+def isArchiveName(name):
+    for ext in COMPRESS_EXTENSIONS.values():
+        if name.endswith(ARCHIVE_SUFFIX + ext):
+            return True
+    return False
+
+def hashFileObj(fd):
+    sha = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = fd.read(HASH_CHUNK_SIZE)
+        if not chunk:
+            break
+        sha.update(chunk)
+        size += len(chunk)
+    return sha.hexdigest(), size
+
+def hashFile(path):
+    with open(path, "rb") as fd:
+        return hashFileObj(fd)
+
+def fileMatches(path, info):
+    """True if the file on disk already has the size and hash recorded in the manifest"""
+    if not os.path.isfile(path) or os.path.getsize(path) != info["size"]:
+        return False
+    return hashFile(path)[0] == info["sha256"]
+
+def readManifest(name):
+    """Read a build manifest from a sidecar .json file or from the first member of an archive"""
+    if name.endswith(".json"):
+        with open(name, "rb") as fd:
+            return json.loads(fd.read().decode("utf-8"))
+
+    reader = BuildArchiveReader(name)
+    fh, tf = reader._open()
+    try:
+        for member in tf:
+            if member.name == MANIFEST_NAME:
+                return json.loads(tf.extractfile(member).read().decode("utf-8"))
+            break
+    finally:
+        tf.close()
+        if fh:
+            fh.close()
+    raise IOError(name + " does not contain a build manifest")
+
+def manifestId(files):
+    """Identifies the build directory contents a manifest describes"""
+    return hashlib.sha256(json.dumps(files, sort_keys=True).encode("utf-8")).hexdigest()
+
+class BuildArchive(object):
+    """
+    Tar archive of an environment's build directory.
+
+    Supports zstd (multi-threaded), gzip and xz compression and stores files
+    with identical content only once.  Entries are collected by add/addfile
+    and written on close() after the build manifest, so the manifest is the
+    first member and can be read without going through the whole archive.
+
+    Given the manifest of a previous archive as baseline, only files that
+    changed since are stored (a delta archive) and removed files are listed
+    in the manifest as deleted.
+    """
+    def __init__(self, name, compress = "none", dedup = False, baseline = None):
+        self.name = name
+        self.compress = resolveCompression(compress)
+        self.dedup = dedup
+        self.baseline = baseline
+        self.entries = []
+        self.hashes = {}
+        self.files = {}
+        self.duplicates = {}
+        self.unchanged = []
+        # only used to build TarInfo objects the same way the real archive will
+        self._info = tarfile.open(fileobj=io.BytesIO(), mode="w")
+
+    def gettarinfo(self, name, arcname = None):
+        return self._info.gettarinfo(name, arcname)
+
+    def _record(self, arcname, sha, size):
+        self.files[arcname] = {"size" : size, "sha256" : sha}
+        if self.baseline is not None:
+            previous = self.baseline["files"].get(arcname, None)
+            if previous is not None and previous["sha256"] == sha:
+                self.unchanged.append(arcname)
+                self.hashes.setdefault(sha, arcname)
+                return True
+        if sha in self.hashes:
+            if self.dedup:
+                self.duplicates[arcname] = self.hashes[sha]
+                return True
+        else:
+            self.hashes[sha] = arcname
+        return False
+
+    def add(self, name):
+        if os.path.isdir(name):
+            self.entries.append(("dir", name, None))
+            for f in sorted(os.listdir(name)):
+                self.add(os.path.join(name, f))
+            return
+
+        sha, size = hashFile(name)
+        if not self._record(self.gettarinfo(name).name, sha, size):
+            self.entries.append(("file", name, None))
+
+    def addfile(self, tarinfo, fileobj):
+        # keep a copy of the data - the source may be gone by the time the archive is written
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        sha = hashlib.sha256()
+        size = 0
+        while True:
+            chunk = fileobj.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha.update(chunk)
+            spool.write(chunk)
+            size += len(chunk)
+        spool.seek(0)
+        if self._record(tarinfo.name, sha.hexdigest(), size):
+            spool.close()
+        else:
+            self.entries.append(("data", tarinfo, spool))
+
+    def manifest(self):
+        manifest = {
+            "version" : MANIFEST_VERSION,
+            "id" : manifestId(self.files),
+            "files" : self.files,
+            "duplicates" : self.duplicates,
+        }
+        if self.baseline is not None:
+            manifest["baseline"] = manifestId(self.baseline["files"])
+            manifest["unchanged"] = sorted(self.unchanged)
+            manifest["deleted"] = sorted(set(self.baseline["files"]) - set(self.files))
+        return manifest
+
+    def writeManifest(self, name):
+        with open(name, "wb") as fd:
+            fd.write(json.dumps(self.manifest(), indent=1, sort_keys=True).encode("utf-8"))
+
+    def _write(self, tf):
+        data = json.dumps(self.manifest(), indent=1, sort_keys=True).encode("utf-8")
+        tarinfo = tarfile.TarInfo(MANIFEST_NAME)
+        tarinfo.size = len(data)
+        tf.addfile(tarinfo, io.BytesIO(data))
+
+        for kind, item, spool in self.entries:
+            if kind == "data":
+                tf.addfile(item, spool)
+                spool.close()
+            else:
+                tf.add(item, recursive=False)
+
+    def close(self):
+        self._info.close()
+        if self.compress == "zstd":
+            cctx = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1)
+            with open(self.name, "wb") as fh:
+                with cctx.stream_writer(fh) as writer:
+                    tf = tarfile.open(fileobj=writer, mode="w|")
+                    try:
+                        self._write(tf)
+                    finally:
+                        tf.close()
+        else:
+            mode = "w" if self.compress == "none" else "w:" + self.compress
+            tf = tarfile.open(self.name, mode)
+            try:
+                self._write(tf)
+            finally:
+                tf.close()
+
+class BuildArchiveReader(object):
+    """
+    Reads a build directory archive written by BuildArchive (or a plain tar)
+    in a single streaming pass.
+
+    Files listed in the manifest are skipped when the copy on disk already
+    matches, otherwise they are written to a temp file, checked against the
+    manifest size/hash and moved into place.  Deduplicated files are restored
+    afterwards.
+
+    A delta archive is applied on top of the baseline already on disk: the
+    unchanged files must match the manifest and deleted files are removed.
+
+    Readers extracting side by side pass the same sharedLock, which is held
+    while any of the SHARED_FILES is checked or written.
+    """
+    def __init__(self, name, sharedLock = None):
+        self.name = name
+        self.sharedLock = sharedLock
+        self.manifest = {}
+        self.extracted = 0
+        self.skipped = 0
+        self.deleted = 0
+
+    def _lockFor(self, *names):
+        if self.sharedLock is not None and any(isSharedFile(name) for name in names):
+            return self.sharedLock
+        return NoLock()
+
+    def _open(self):
+        if self.name.endswith(COMPRESS_EXTENSIONS["zstd"]):
+            if zstandard is None:
+                raise RuntimeError("zstandard module required to extract " + self.name)
+            fh = open(self.name, "rb")
+            reader = zstandard.ZstdDecompressor().stream_reader(fh)
+            return fh, tarfile.open(fileobj=reader, mode="r|")
+        return None, tarfile.open(self.name, "r|*")
+
+    def _makeDirs(self, dest):
+        destDir = os.path.dirname(dest)
+        if destDir and not os.path.isdir(destDir):
+            try:
+                os.makedirs(destDir)
+            except OSError:
+                # another extractor may have just created it
+                if not os.path.isdir(destDir):
+                    raise
+
+    def _extractVerified(self, tf, member, dest, info):
+        self._makeDirs(dest)
+        tmpPath = "{}.{}.tmp".format(dest, os.getpid())
+        src = tf.extractfile(member)
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmpPath, "wb") as fd:
+                while True:
+                    chunk = src.read(HASH_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    sha.update(chunk)
+                    fd.write(chunk)
+                    size += len(chunk)
+
+            if size != info["size"] or sha.hexdigest() != info["sha256"]:
+                raise IOError("{} in {} failed the manifest integrity check".format(member.name, self.name))
+
+            os.chmod(tmpPath, member.mode)
+            os.utime(tmpPath, (member.mtime, member.mtime))
+            replaceFile(tmpPath, dest)
+        finally:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+
+    def extractall(self, path = "."):
+        fh, tf = self._open()
+        try:
+            for member in tf:
+                if member.name == MANIFEST_NAME:
+                    self.manifest = json.loads(tf.extractfile(member).read().decode("utf-8"))
+                    continue
+
+                info = self.manifest.get("files", {}).get(member.name, None)
+                with self._lockFor(member.name):
+                    if member.isfile() and info is not None:
+                        dest = os.path.join(path, member.name)
+                        if fileMatches(dest, info):
+                            self.skipped += 1
+                        else:
+                            self._extractVerified(tf, member, dest, info)
+                            self.extracted += 1
+                    else:
+                        tf.extract(member, path)
+                        if member.isfile():
+                            self.extracted += 1
+        finally:
+            tf.close()
+            if fh:
+                fh.close()
+
+        files = self.manifest.get("files", {})
+        for arcname in self.manifest.get("unchanged", []):
+            with self._lockFor(arcname):
+                if not fileMatches(os.path.join(path, arcname), files[arcname]):
+                    raise IOError("{} is a delta archive but {} does not match the baseline".format(self.name, arcname))
+            self.skipped += 1
+
+        for arcname in self.manifest.get("deleted", []):
+            dest = os.path.join(path, arcname)
+            with self._lockFor(arcname):
+                if os.path.isfile(dest):
+                    os.remove(dest)
+                    self.deleted += 1
+
+        for arcname, original in self.manifest.get("duplicates", {}).items():
+            dest = os.path.join(path, arcname)
+            with self._lockFor(arcname, original):
+                if arcname in files and fileMatches(dest, files[arcname]):
+                    self.skipped += 1
+                    continue
+                self._makeDirs(dest)
+                tmpPath = "{}.{}.tmp".format(dest, os.getpid())
+                shutil.copy2(os.path.join(path, original), tmpPath)
+                replaceFile(tmpPath, dest)
+                self.extracted += 1
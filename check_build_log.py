@@ -55,6 +55,68 @@ def _compile_phrase_regex(phrases):
 FAIL_RX = _compile_phrase_regex(VC_failurePhrases)
 UNSTABLE_RX = _compile_phrase_regex(VC_unstablePhrases)
 
+CHUNK_SIZE = 1024 * 1024
+
+class BuildLogScanner(object):
+    """
+    Incrementally scans build log data for failure/unstable phrases.
+
+    Data is fed in binary chunks (e.g. while the log is being copied) and only
+    complete lines are matched, so a phrase is never missed at a chunk boundary.
+    """
+    def __init__(self, enc: str = None):
+        self.enc = enc if enc else getVectorCASTEncoding()
+        self.found_fail = set()
+        self.found_unstable = set()
+        self._partial = b""
+
+    def _scan(self, raw: bytes) -> None:
+        text = raw.decode(self.enc, "replace")
+
+        if FAIL_RX:
+            for m in FAIL_RX.finditer(text):
+                self.found_fail.add(m.group(0))
+
+        if UNSTABLE_RX:
+            for m in UNSTABLE_RX.finditer(text):
+                self.found_unstable.add(m.group(0))
+
+    def feed(self, data: bytes) -> None:
+        data = self._partial + data
+        idx = data.rfind(b"\n")
+        if idx < 0:
+            self._partial = data
+            return
+        self._partial = data[idx + 1:]
+        self._scan(data[:idx + 1])
+
+    def close(self) -> None:
+        if self._partial:
+            self._scan(self._partial)
+            self._partial = b""
+
+    def report(self) -> int:
+        """
+        Returns:
+          0 = ok
+          1 = unstable phrase found
+          2 = failure phrase found
+        """
+        if self.found_fail:
+            print("FAILURE phrases found:")
+            for s in sorted(self.found_fail):
+                print(f"  - {s}")
+            return 2
+
+        if self.found_unstable:
+            print("UNSTABLE phrases found:")
+            for s in sorted(self.found_unstable):
+                print(f"  - {s}")
+            return 1
+
+        print("No failure/unstable phrases found.")
+        return 0
+
 def check_build_log(log_name: str) -> int:
     """
     Returns:
@@ -67,37 +129,18 @@ def check_build_log(log_name: str) -> int:
         print(f"Build log named {log_name} does not exist")
         return -1
 
-    enc = getVectorCASTEncoding()
-
-    found_fail = set()
-    found_unstable = set()
+    scanner = BuildLogScanner()
 
     with open(log_name, "rb") as fd:
-        for raw in fd:
-            line = raw.decode(enc, "replace")
-
-            m = FAIL_RX.search(line) if FAIL_RX else None
-            if m:
-                found_fail.add(m.group(0))
-
-            m = UNSTABLE_RX.search(line) if UNSTABLE_RX else None
-            if m:
-                found_unstable.add(m.group(0))
-
-    if found_fail:
-        print("FAILURE phrases found:")
-        for s in sorted(found_fail):
-            print(f"  - {s}")
-        return 2
-
-    if found_unstable:
-        print("UNSTABLE phrases found:")
-        for s in sorted(found_unstable):
-            print(f"  - {s}")
-        return 1
-
-    print("No failure/unstable phrases found.")
-    return 0
+        while True:
+            chunk = fd.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            scanner.feed(chunk)
+
+    scanner.close()
+
+    return scanner.report()
 
 
 if __name__ == "__main__":
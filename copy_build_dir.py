@@ -29,8 +29,12 @@ import tarfile
 import sqlite3
 import shutil
 import argparse
+import tempfile
+import io
 
 from vcast_utils import dump, checkVectorCASTVersion, getVectorCASTEncoding
+from build_archive import BuildArchive, archiveName, readManifest, COMPRESS_CHOICES
+from sqlite_paths import register_path_function
 
 if not checkVectorCASTVersion(19):
     print ("Copy build directory for pipelines not supported. Please upgrade VectorCAST")
@@ -90,12 +94,19 @@ def make_relative(path, workspace, vCastProjectWorkspace, mpName):
 
 
 def updateDatabase(conn, nocase, workspace, updateWhat, updateFrom, vCastProjectWorkspace, mpName):
-    sql = "SELECT id, %s FROM %s" % (updateWhat, updateFrom)
-    files = conn.execute(sql)
-    for id_, path in files:
-        relative = make_relative(path,workspace, vCastProjectWorkspace, mpName)
-        sql = "UPDATE %s SET %s = '%s' WHERE id=%s COLLATE NOCASE" % (updateFrom, updateWhat, relative, id_)
-        conn.execute(sql)
+
+    # make_relative is applied by SQLite in a single UPDATE.  Path matching is
+    # case-insensitive in make_relative itself, so no collation is needed
+    def make_relative_sql(path):
+        if path is None:
+            return None
+        return make_relative(path, workspace, vCastProjectWorkspace, mpName)
+
+    register_path_function(conn, "make_relative", 1, make_relative_sql)
+
+    sql = "UPDATE %s SET %s = make_relative(%s) WHERE %s IS NOT NULL AND %s != make_relative(%s)" % \
+        (updateFrom, updateWhat, updateWhat, updateWhat, updateWhat, updateWhat)
+    conn.execute(sql)
 
 def addFile(tf, file, build_dir, backOneDir = False):
 
@@ -125,55 +136,108 @@ def addDirectory(tf, build_dir, dir):
             for fname in fileList:
                 tf.add(os.path.join(dirName, fname))
 
-def addConvertCoverFile(tf, file, workspace, build_dir, nocase, vCastProjectWorkspace, mpName, noTar):
+# snapshots of databases up to this size are converted in memory, larger ones in a temp file
+SNAPSHOT_MEMORY_LIMIT = 512 * 1024 * 1024
+
+def canSnapshot():
+    return hasattr(sqlite3.Connection, "backup")
+
+def addSnapshotDatabase(tf, file, build_dir, convert):
+    """
+    Adds a converted copy of a database to the tar without touching the original.
+
+    The database is copied with the SQLite backup API, convert(conn) updates the
+    copy and the result is written to the tar under the original's name.
+    """
+    fullpath = build_dir + os.path.sep + file
+    tmpPath = None
+
+    src = sqlite3.connect(fullpath)
+    try:
+        inMemory = hasattr(src, "serialize") and os.path.getsize(fullpath) <= SNAPSHOT_MEMORY_LIMIT
+        if inMemory:
+            dst = sqlite3.connect(":memory:")
+        else:
+            fd, tmpPath = tempfile.mkstemp(suffix=".db")
+            os.close(fd)
+            dst = sqlite3.connect(tmpPath)
+
+        try:
+            src.backup(dst)
+            convert(dst)
+            dst.commit()
+
+            tarinfo = tf.gettarinfo(fullpath, os.path.join(build_dir, file))
+            if inMemory:
+                data = dst.serialize()
+                tarinfo.size = len(data)
+                tf.addfile(tarinfo, io.BytesIO(data))
+        finally:
+            dst.close()
+
+        if not inMemory:
+            tarinfo.size = os.path.getsize(tmpPath)
+            with open(tmpPath, "rb") as fd:
+                tf.addfile(tarinfo, fd)
+    finally:
+        src.close()
+        if tmpPath is not None:
+            os.remove(tmpPath)
+
+def convertCoverDatabase(conn, nocase, workspace, vCastProjectWorkspace, mpName):
+    # update the database paths to be relative from workspace
+    try:
+        updateDatabase(conn, nocase, workspace, "LIS_file", "instrumented_files", vCastProjectWorkspace, mpName)
+    except:
+        updateDatabase(conn, nocase, workspace, "path", "lis_files" , vCastProjectWorkspace, mpName)
+    updateDatabase(conn, nocase, workspace, "display_path", "source_files", vCastProjectWorkspace, mpName)
+    updateDatabase(conn, nocase, workspace, "path", "source_files", vCastProjectWorkspace, mpName)
+
+def convertMasterDatabase(conn, nocase, workspace, vCastProjectWorkspace, mpName):
+    updateDatabase(conn, nocase, workspace, "path", "sourcefiles", vCastProjectWorkspace, mpName)
+
+def addConvertDatabase(tf, file, workspace, build_dir, nocase, vCastProjectWorkspace, mpName, noTar, convert):
 
     fullpath = build_dir + os.path.sep + file
     bakpath = fullpath + '.bk'
 
-    print("Updating cover.db: " + fullpath)
+    if not os.path.isfile(fullpath):
+        return
+
+    # converting for the tar only - leave the original alone
+    if not noTar and canSnapshot():
+        addSnapshotDatabase(tf, file, build_dir,
+            lambda conn: convert(conn, nocase, workspace, vCastProjectWorkspace, mpName))
+        return
+
+    conn = sqlite3.connect(fullpath)
+    if conn:
+        shutil.copyfile(fullpath, bakpath)
+        convert(conn, nocase, workspace, vCastProjectWorkspace, mpName)
+        conn.commit()
+        conn.close()
+        addFile(tf, file, build_dir)
+        if not noTar:
+            os.remove(fullpath)
+            shutil.move(bakpath, fullpath)
 
-    if os.path.isfile(fullpath):
-        conn = sqlite3.connect(fullpath)
-        if conn:
-            shutil.copyfile(fullpath, bakpath)
+def addConvertCoverFile(tf, file, workspace, build_dir, nocase, vCastProjectWorkspace, mpName, noTar):
 
-            # update the database paths to be relative from workspace
-            try:
-                updateDatabase(conn, nocase, workspace, "LIS_file", "instrumented_files", vCastProjectWorkspace, mpName)
-            except:
-                updateDatabase(conn, nocase, workspace, "path", "lis_files" , vCastProjectWorkspace, mpName)
-            updateDatabase(conn, nocase, workspace, "display_path", "source_files", vCastProjectWorkspace, mpName)
-            updateDatabase(conn, nocase, workspace, "path", "source_files", vCastProjectWorkspace, mpName)
+    print("Updating cover.db: " + build_dir + os.path.sep + file)
 
-            conn.commit()
-            conn.close()
-            addFile(tf, file, build_dir)
-            if not noTar:
-                os.remove(fullpath)
-                shutil.move(bakpath, fullpath)
+    addConvertDatabase(tf, file, workspace, build_dir, nocase, vCastProjectWorkspace, mpName, noTar, convertCoverDatabase)
 
 def addConvertMasterFile(tf, file, workspace, build_dir, nocase, vCastProjectWorkspace, mpName, noTar):
     print("Updating master.db")
-    fullpath = build_dir + os.path.sep + file
-    bakpath = fullpath + '.bk'
-    if os.path.isfile(fullpath):
-        conn = sqlite3.connect(fullpath)
-        if conn:
-            shutil.copyfile(fullpath, bakpath)
-            updateDatabase(conn, nocase, workspace, "path", "sourcefiles", vCastProjectWorkspace, mpName)
-            conn.commit()
-            conn.close()
-            addFile(tf, file, build_dir)
-            if not noTar:
-                os.remove(fullpath)
-                shutil.move(bakpath, fullpath)
+
+    addConvertDatabase(tf, file, workspace, build_dir, nocase, vCastProjectWorkspace, mpName, noTar, convertMasterDatabase)
 
 def addConvertFiles(tf, workspace, build_dir, nocase, vCastProjectWorkspace, mpName, noTar):
     addConvertCoverFile (tf, "cover.db",  workspace, build_dir, nocase, vCastProjectWorkspace, mpName, noTar)
     addConvertMasterFile(tf, "master.db", workspace, build_dir, nocase, vCastProjectWorkspace, mpName, noTar)
 
 
-def run(mpName, level, basename, env, workspace, vCastProjectWorkspace, noTar):
+def run(mpName, level, basename, env, workspace, vCastProjectWorkspace, noTar, compress = "none", dedup = False, deltaFrom = None, manifestOut = None):
 
     if sys.platform.startswith('win32'):
         workspace = workspace.replace("\\", "/")
@@ -206,9 +270,13 @@ def run(mpName, level, basename, env, workspace, vCastProjectWorkspace, noTar):
     if build_dir != "":
         build_dir = build_dir + os.path.sep + env
         if noTar:
-            tf = tarfile.open("delete_me_" + basename + "_build.tar", mode='w')
+            tf = BuildArchive("delete_me_" + basename + "_build.tar")
         else:
-            tf = tarfile.open(basename + "_build.tar", mode='w')
+            baseline = None
+            if deltaFrom:
+                print("Creating delta archive against " + deltaFrom)
+                baseline = readManifest(deltaFrom)
+            tf = BuildArchive(archiveName(basename, compress), compress, dedup, baseline)
         try:
             addConvertFiles(tf, workspace, build_dir, nocase, vCastProjectWorkspace, mpName, noTar)
             addFile(tf, "testcase.db", build_dir)
@@ -236,6 +304,9 @@ def run(mpName, level, basename, env, workspace, vCastProjectWorkspace, noTar):
         finally:
             tf.close()
 
+        if manifestOut and not noTar:
+            tf.writeManifest(manifestOut)
+
         if noTar:
             os.remove("delete_me_" + basename + "_build.tar")
 
@@ -258,6 +329,10 @@ if __name__ == '__main__':
     parser.add_argument('-b', '--basename',    help='Basename for the tar file',    default="")
     parser.add_argument('-e', '--environment', help='Enable verbose output', default="")
     parser.add_argument('--notar',             help='Don\'t Product a tar file', default=False, action="store_true")
+    parser.add_argument('--compress',          help='Compress the tar file (default = none). auto uses zstd when available, otherwise gzip', choices=COMPRESS_CHOICES, default="none")
+    parser.add_argument('--delta_from',        help='Build manifest (.json or previous tar file) to create a delta tar file against. Only changed files are stored', default=None)
+    parser.add_argument('--manifest_out',      help='Also write the build manifest to this .json file for use with a later --delta_from', default=None)
+    parser.add_argument('--dedup',             help='Store files with identical content only once in the tar file', default=False, action="store_true")
     parser.add_argument('-v', '--verbose',     help='Enable verbose output',     action="store_true")
 
     args = parser.parse_args()
@@ -284,4 +359,4 @@ if __name__ == '__main__':
 
     os.environ['VCAST_MANAGE_PROJECT_DIRECTORY'] = os.path.abspath(mpName).rsplit(".",1)[0]
 
-    run(mpName, level, basename, env, workspace, vCastProjectWorkspace, noTar)
+    run(mpName, level, basename, env, workspace, vCastProjectWorkspace, noTar, args.compress, args.dedup, args.delta_from, args.manifest_out)
@@ -22,6 +22,7 @@
 # THE SOFTWARE.
 #
 import os
+import re
 import sys
 import argparse
 import glob
@@ -71,56 +72,89 @@ def getEnvName(search_string, filename):
 
     return env_name
 
-def getReportName(filename):
-
-    reportName = filename
-    reportType = 0
-
-    if searchKeyword(">Aggregate Coverage Report<", filename)[0] != -1:
-        env_name = getEnvName("<tr><th>Environment Name</th><td>",filename)
-        reportName = "Aggregate Coverage Report"
-        if env_name:
-            reportName += " " + env_name
-            reportType = 1
-
-    elif searchKeyword(">Full Status Section<", filename)[0] != -1:
-        reportName = "Full Status Report"
-
-    elif searchKeyword("Testcase Management Report", filename)[0] != -1:
-        env_name = getEnvName("<tr><th>Environment Name</th><td>",filename)
-        reportName = "Testcase Management Report " + env_name
-        reportType = 3
-
-    elif searchKeyword("Test Results Management Report", filename)[0] != -1:
-        env_name = getEnvName("<tr><th>Environment Name</th><td>",filename)
-        reportName = "Test Results Management Report " + env_name
-        reportType = 3
+# report titles and the environment name are in the first part of every report
+REPORT_HEADER_SIZE = 1024 * 1024
+CLASSIFY_JOBS = 8
+
+ENV_NAME_MARKER = "<tr><th>Environment Name</th><td>"
+
+# (title marker, report name, report type, report name ends with the environment name)
+# checked in this order - the first marker found in the header wins
+REPORT_MARKERS = [
+    (">Aggregate Coverage Report<",        "Aggregate Coverage Report",       1, True),
+    (">Full Status Section<",              "Full Status Report",              0, False),
+    ("Testcase Management Report",         "Testcase Management Report",      3, True),
+    ("Test Results Management Report",     "Test Results Management Report",  3, True),
+    ("Manage Incremental Rebuild Report",  "Incremental Report Report",       0, False),
+    (">Metrics Report<",                   "Metrics Report",                  0, False),
+    (">Test Case Summary Report<",         "System Test Status Report",       0, False),
+    (">PC-Lint Plus Results<",             "PC-Lint Plus Results",            0, False),
+    (">Full Report<",                      "Full Report",                     1, True),
+]
+
+REPORT_MARKER_RE = re.compile(
+    "|".join(re.escape(marker) for marker, _, _, _ in REPORT_MARKERS) +
+    "|" + re.escape(ENV_NAME_MARKER) + "([^<\n]*)")
+
+# (path, mtime, size) -> (report name or None for the file name, report type)
+_reportNameCache = {}
+
+def classifyReport(filename):
+    """
+    Classifies a report from the first REPORT_HEADER_SIZE bytes, matching all
+    the title markers in one pass.  Returns (report name or None, report type).
+    """
+    with open(filename, "rb") as fd:
+        header = fd.read(REPORT_HEADER_SIZE).decode(encFmt, "replace")
+
+    found = set()
+    env_name = None
+    for match in REPORT_MARKER_RE.finditer(header):
+        if match.group(0).startswith(ENV_NAME_MARKER):
+            if env_name is None:
+                env_name = match.group(1)
+        else:
+            found.add(match.group(0))
 
-    elif searchKeyword("Manage Incremental Rebuild Report", filename)[0] != -1:
-        reportName = "Incremental Report Report"
+    for marker, name, reportType, withEnvName in REPORT_MARKERS:
+        if marker not in found:
+            continue
+        if withEnvName:
+            if env_name:
+                name += " " + env_name
+            elif marker == ">Aggregate Coverage Report<":
+                # aggregate report of the whole project
+                reportType = 0
+        return name, reportType
 
-    elif searchKeyword(">Metrics Report<", filename)[0] != -1:
-        reportName = "Metrics Report"
+    return None, 2
 
-    elif searchKeyword(">Test Case Summary Report<", filename)[0] != -1:
-        reportName = "System Test Status Report"
+def getReportName(filename):
 
-    elif searchKeyword(">PC-Lint Plus Results<", filename)[0] != -1:
-        reportName = "PC-Lint Plus Results"
+    st = os.stat(filename)
+    key = (os.path.abspath(filename), st.st_mtime, st.st_size)
+    try:
+        reportName, reportType = _reportNameCache[key]
+    except KeyError:
+        reportName, reportType = _reportNameCache[key] = classifyReport(filename)
 
-    elif searchKeyword(">PC-Lint Plus Results<", filename)[0] != -1:
-        reportName = "PC-Lint Plus Results"
+    if reportName is None:
+        reportName = filename
 
-    elif searchKeyword(">Full Report<", filename)[0] != -1:
-        reportName = "Full Report "
-        reportName += getEnvName("<tr><th>Environment Name</th><td>",filename)
+    return reportName, reportType
 
-        reportType = 1
+def getReportNames(filenames):
+    """getReportName for each file, read in parallel"""
+    try:
+        from concurrent.futures import ThreadPoolExecutor
+    except ImportError:
+        return [getReportName(filename) for filename in filenames]
 
-    else:
-        reportType = 2
+    if len(filenames) < 2:
+        return [getReportName(filename) for filename in filenames]
 
-    return reportName, reportType
+    with ThreadPoolExecutor(max_workers=min(CLASSIFY_JOBS, len(filenames))) as executor:
+        return list(executor.map(getReportName, filenames))
 
 usingGitLabCI = False
 baseOutputDir = ""
@@ -175,9 +209,7 @@ def create_index_html_body ():
     indEnvTcmrEntries = []
     miscEntries = []
 
-    for html_file_name in htmlReportList:
-        
-        reportName, reportType = getReportName(html_file_name)
+    for html_file_name, (reportName, reportType) in zip(htmlReportList, getReportNames(htmlReportList)):
 
         if reportType == 1:
             indEnvFullEntries.append((reportName,html_file_name))
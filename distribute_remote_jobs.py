@@ -125,7 +125,7 @@ class DistributeRemoteJobs (object):
             self.execManageCommand("--export-result " + self.resultsFile)
             
             
-            merge_vcr.run(origVcrFile, newVcrFile, verbose=self.verbose)
+            merge_vcr.merge_many(origVcrFile, [newVcrFile], self.resultsFile, verbose=self.verbose)
             
 
 if __name__ == '__main__':
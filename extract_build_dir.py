@@ -25,30 +25,68 @@
 from __future__ import print_function
 
 import os
-import tarfile
 import sys
+import argparse
+import multiprocessing
 
-def run(leaveFiles = False):
+from build_archive import BuildArchiveReader, isArchiveName
 
-    for file in os.listdir("."):
-        if file.endswith("_build.tar"):
-            print("* Extracting " + file)
-            try:
-                tf = tarfile.open(file, "r")
-                tf.extractall()
-                tf.close()
-            except:
-                print("Problem with tarfile " + file + "...skipping")
-        if not leaveFiles:
-            os.remove(file)
+# held by a pool worker while it writes a file every archive shares (CCAST_.CFG...)
+sharedLock = None
+
+def initWorker(lock):
+    global sharedLock
+    sharedLock = lock
+
+def extractArchive(file):
+    try:
+        reader = BuildArchiveReader(file, sharedLock)
+        reader.extractall()
+        return file, True, "{} extracted, {} already up to date, {} deleted".format(reader.extracted, reader.skipped, reader.deleted)
+    except Exception as e:
+        return file, False, str(e)
+
+def run(leaveFiles = False, jobs = None):
+
+    archives = sorted([file for file in os.listdir(".") if isArchiveName(file)])
+    if not archives:
+        return
+
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    jobs = max(1, min(jobs, len(archives)))
+
+    for file in archives:
+        print("* Extracting " + file)
+
+    # each archive holds a different environment, so they can be unpacked side by
+    # side - only the files next to the build directories that every archive
+    # holds a copy of are written one archive at a time
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, initWorker, (multiprocessing.Lock(),))
+        try:
+            results = pool.map(extractArchive, archives)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [extractArchive(file) for file in archives]
+
+    for file, ok, msg in results:
+        if ok:
+            print("  " + file + ": " + msg)
+            if not leaveFiles:
+                os.remove(file)
+        else:
+            print("Problem with tarfile " + file + "...skipping (" + msg + ")")
 
 
 if __name__ == '__main__':
 
-    leaveFiles = False
-    try:
-        if len(sys.argv) > 1:
-            leaveFiles = True
-    except:
-        pass
-    run(leaveFiles)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('leave', nargs='*', help='Leave the tar files in place if any argument is given')
+    parser.add_argument('--jobs', '-j', help='Number of archives to extract concurrently (default = # of CPUs)', type=int, default=None)
+    args = parser.parse_args()
+
+    leaveFiles = len(args.leave) > 0
+    run(leaveFiles, args.jobs)
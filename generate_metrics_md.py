@@ -43,6 +43,72 @@ FAIL = u"\u274C"
 PARTIAL = u"\U0001F7E1"
 PART = PARTIAL
 
+def emoji_for(pct):
+    """Return (emoji, weight) where weight contributes to severity."""
+    try:
+        p = float(pct)
+    except Exception:
+        return u"", 0
+
+    if p >= 100.0:
+        return PASS, -1         # perfect -> bonus credit
+    elif p >= 80.0:
+        return PASS, 0          # solid
+    elif p >= 50.0:
+        return PART, 1          # fair
+    elif p > 0.0:
+        return PART, 2          # weak
+    else:
+        return FAIL, 3          # failed
+
+def severity_for(emoji_pairs):
+    """Compute overall severity using average weighted score."""
+    weights = [w for (_, w) in emoji_pairs if w is not None]
+    if not weights:
+        return "LOW"
+
+    avg = sum(weights) / float(len(weights))
+
+    if avg <= 0:         # many perfect or high scores
+        return "LOW"
+    elif avg <= 0.75:    # mostly PASS with some PART
+        return "MEDIUM"
+    elif avg <= 1.75:    # mix of PASS/PART and a few FAIL
+        return "HIGH"
+    else:                # mostly FAIL
+        return "CRITICAL"
+
+def writeMetricsMarkdown(mpReportName, summary, rows):
+    """Write <report>_summary.md and return (summary, rows, link to the HTML report artifact)"""
+    encFmt = "utf-8"
+
+    # --- build Markdown output ---
+    md_lines = [u"## Summary", summary, u"\n## Annotations",
+                u"| File | Summary | Severity |",
+                u"|------|----------|-----------|"]
+
+    for file_, cov, sev in rows:
+        md_lines.append(u"| {0} | {1} | {2} |".format(file_, cov, sev))
+
+    md_text = u"\n".join(md_lines)
+    md_path = os.path.splitext(mpReportName)[0] + "_summary.md"
+
+    with io.open(md_path, "w", encoding=encFmt) as out:
+        out.write(md_text + u"\n")
+
+    print(u"Markdown written to {}".format(md_path))
+    
+    artifactName = mpReportName.replace("_metrics_report.txt","_aggregate_report.html")
+    
+    workspace = os.environ['BITBUCKET_WORKSPACE']
+    repo_slug = os.environ['BITBUCKET_REPO_SLUG']
+    build_num = os.environ['BITBUCKET_BUILD_NUMBER']
+    
+    # --- Append link to full HTML report ---
+    html_artifact_url = "https://bitbucket.org/{}/{}/addons/bitbucket-build/{}/artifacts/reports/html/{}".format(workspace, repo_slug, build_num, artifactName)
+
+    return summary, rows, html_artifact_url
+
 def updateTextMetricsReport(mpReportName):
     """
     Parse a VectorCAST metrics report (.txt) and return:
@@ -51,42 +117,6 @@ def updateTextMetricsReport(mpReportName):
     """
     encFmt = "utf-8"
     COV_RE = re.compile(r"\(([\d.]+)%\)")
-    TOTALS_RE = re.compile(r"^\s*(?:GRAND\s+)?TOTALS\b", re.IGNORECASE)
-
-    def emoji_for(pct):
-        """Return (emoji, weight) where weight contributes to severity."""
-        try:
-            p = float(pct)
-        except Exception:
-            return u"", 0
-
-        if p >= 100.0:
-            return PASS, -1         # perfect -> bonus credit
-        elif p >= 80.0:
-            return PASS, 0          # solid
-        elif p >= 50.0:
-            return PART, 1          # fair
-        elif p > 0.0:
-            return PART, 2          # weak
-        else:
-            return FAIL, 3          # failed
-
-    def severity_for(emoji_pairs):
-        """Compute overall severity using average weighted score."""
-        weights = [w for (_, w) in emoji_pairs if w is not None]
-        if not weights:
-            return "LOW"
-
-        avg = sum(weights) / float(len(weights))
-
-        if avg <= 0:         # many perfect or high scores
-            return "LOW"
-        elif avg <= 0.75:    # mostly PASS with some PART
-            return "MEDIUM"
-        elif avg <= 1.75:    # mix of PASS/PART and a few FAIL
-            return "HIGH"
-        else:                # mostly FAIL
-            return "CRITICAL"
 
     # --- find the metrics text file ---
     if not os.path.exists(mpReportName):
@@ -149,38 +179,76 @@ def updateTextMetricsReport(mpReportName):
         summary = u"Overall Coverage: FN {0} | ST {1} | BR {2} | PR {3} | FC {4}".format(
             emojis[0], emojis[1], emojis[2], emojis[3], emojis[4])
 
-    # --- build Markdown output ---
-    md_lines = [u"## Summary", summary, u"\n## Annotations",
-                u"| File | Summary | Severity |",
-                u"|------|----------|-----------|"]
+    return writeMetricsMarkdown(mpReportName, summary, rows)
+
+# (total, covered) attribute pairs of the cover API metrics, in FN, ST, BR, PR, FC order
+METRIC_FIELDS = [
+    (("functions",),                 ("max_covered_functions", "max_annotations_functions")),
+    (("statements",),                ("max_covered_statements", "max_annotations_statements")),
+    (("branches", "mcdc_branches"),  ("max_covered_branches", "max_covered_mcdc_branches",
+                                      "max_annotations_branches", "max_annotations_mcdc_branches")),
+    (("mcdc_pairs",),                ("max_covered_mcdc_pairs", "max_annotations_mcdc_pairs")),
+    (("function_calls",),            ("max_covered_function_calls", "max_annotations_function_calls")),
+]
+
+def metricCounts(metrics):
+    """[(total, covered), ...] in FN, ST, BR, PR, FC order"""
+    return [
+        (sum(getattr(metrics, name) for name in totals), sum(getattr(metrics, name) for name in covered))
+        for totals, covered in METRIC_FIELDS
+    ]
+
+def coverageString(counts, prefix = u""):
+    """Summary string and severity for counts - coverage types with nothing to cover are left blank"""
+    pcts = [100.0 * covered / total if total else None for total, covered in counts]
+    emoji_pairs = [emoji_for(p) if p is not None else (u"", None) for p in pcts]
+    emojis = [e for (e, _) in emoji_pairs]
+    coverage_str = prefix + u"FN {0} | ST {1} | BR {2} | PR {3} | FC {4}".format(*emojis)
+    return coverage_str, severity_for(emoji_pairs)
+
+def directMetricsMarkdown(mpName, mpReportName):
+    """
+    Build the Markdown rows from the per-file metrics of the project's cover
+    API instead of rendering and parsing the METRICS text report
+    """
+    rows = []
+    totals = [[0, 0] for _ in METRIC_FIELDS]
 
-    for file_, cov, sev in rows:
-        md_lines.append(u"| {0} | {1} | {2} |".format(file_, cov, sev))
+    with VCProjectApi(mpName) as vcproj:
+        api = vcproj.project.cover_api
+        for file in api.SourceFile.all():
+            if file.display_name == "":
+                continue
+            counts = metricCounts(file.metrics)
+            if not any(total for total, covered in counts):
+                continue
 
-    md_text = u"\n".join(md_lines)
-    md_path = os.path.splitext(mpReportName)[0] + "_summary.md"
+            for index, (total, covered) in enumerate(counts):
+                totals[index][0] += total
+                totals[index][1] += covered
 
-    with io.open(md_path, "w", encoding=encFmt) as out:
-        out.write(md_text + u"\n")
+            coverage_str, severity = coverageString(counts)
+            rows.append([file.display_name, coverage_str, severity])
 
-    print(u"Markdown written to {}".format(md_path))
-    
-    artifactName = mpReportName.replace("_metrics_report.txt","_aggregate_report.html")
-    
-    workspace = os.environ['BITBUCKET_WORKSPACE']
-    repo_slug = os.environ['BITBUCKET_REPO_SLUG']
-    build_num = os.environ['BITBUCKET_BUILD_NUMBER']
-    
-    # --- Append link to full HTML report ---
-    html_artifact_url = "https://bitbucket.org/{}/{}/addons/bitbucket-build/{}/artifacts/reports/html/{}".format(workspace, repo_slug, build_num, artifactName)
+    rows.sort(key=lambda row: row[0].lower())
 
-    return summary, rows, html_artifact_url
+    summary = u""
+    if rows:
+        summary, _ = coverageString(totals, u"Overall Coverage: ")
 
-def generate_metrics_md(mpName):
+    return writeMetricsMarkdown(mpReportName, summary, rows)
+
+def generate_metrics_md(mpName, from_report = False):
     
     print("Generating metrics to BitBucket in Markdown format")
     mpBaseName = os.path.basename(mpName)[:-4]
     report_name = "{}_metrics_report.txt".format(mpBaseName)
+
+    if not from_report:
+        try:
+            return directMetricsMarkdown(mpName, report_name)
+        except (AttributeError, TypeError) as e:
+            print("Unable to read metrics from the cover API ({})...using the METRICS report".format(e))
     
     with VCProjectApi(mpName) as vcproj:
         CustomReport.report_from_api(vcproj, report_type="Demo", formats=["TEXT"], output_file=report_name, sections=["METRICS"])
@@ -193,6 +261,7 @@ if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('manageProject' , help='VectorCAST Project name')
+    parser.add_argument('--from_report', action='store_true', help='Parse the METRICS text report instead of reading the cover API', default=False)
     args = parser.parse_args()
     
     if not args.manageProject.endswith(".vcm"):
@@ -202,4 +271,4 @@ if __name__ == '__main__':
         print ("VectorCAST Project not found! " + args.manageProject)
         sys.exit(-1)
 
-    summary, rows = generate_metrics_md(args.manageProject)
+    summary, rows, link = generate_metrics_md(args.manageProject, args.from_report)
@@ -28,8 +28,6 @@ try:
 except ImportError:
     # html not standard module in Python 2.
     from cgi import escape
-import json
-import xml.etree.ElementTree
 import os, sys
 
 from pprint import pprint
@@ -45,22 +43,15 @@ except:
 
 from global_state import globalState
 
-# PC-lint Plus message representation and parsing
+from pclp_messages import (Message, msg_items, FileSummary, iter_raw_msgs, build_msgs, load_msgs,
+    text_format_msg, emit_text, iter_text, json_transform_key, json_should_include_item, json_serialize_msg,
+    emit_json, iter_json, gitlab_fingerprint, gitlab_serialize_msg, emit_gitlab, iter_gitlab, write_output, write_chunks,
+    read_baseline, write_baseline, BaselineDiff, emit_delta_json)
+import pclp_messages
 
-class Message:
-    def __init__(self, file, line, category, number, text):
-        self.file = file if file is not None else ''
-        self.line = line
-        self.category = category
-        self.number = number
-        self.text = text
-        self.supplementals = []
-
-def parse_msgs(filename):
-
-    # save the base directory of the input file
-    directoryName = os.path.dirname(filename)
+# PC-lint Plus message parsing - see pclp_messages.py
 
+def get_basepath():
     try:
         basepath = os.environ['CI_PROJECT_DIR'].replace("\\","/") + "/"
     except:
@@ -68,93 +59,47 @@ def parse_msgs(filename):
             basepath = os.environ['WORKSPACE'].replace("\\","/") + "/"
         except:
             basepath = os.getcwd().replace("\\","/") + "/"
-    
-    os.environ['VCAST_RPTS_CUSTOM_CSS']= basepath + "/vc_scripts/css/tooltip.css"
-
-    with open(filename, "rb") as fd:
-        pcplXmlData = fd.read().decode(encFmt, "replace")
-
-    index = pcplXmlData.find('<')
+    return basepath
 
-    # If '<' is found, slice the string to remove characters before it
-    if index != -1:
-        pcplXmlData = pcplXmlData[index:]
-
-    root = xml.etree.ElementTree.fromstring(pcplXmlData)
-    # pprint(dump(tree))
-    # root = tree.getroot()
-    msgs = []
-    last_primary_msg = None
-    for child in root:
-        try:
-            adjustedFname = os.path.relpath(child.find('file').text,basepath).replace("\\","/")
-        except:
-            adjustedFname = child.find('file').text.replace("\\","/")
+def make_file_adjuster(filename, basepath):
+    # save the base directory of the input file
+    directoryName = os.path.dirname(filename)
 
-        if adjustedFname is None:
+    def adjust_file(fname):
+        if fname is None:
             adjustedFname = "GLOBAL"
-
-        msg = Message(
-            adjustedFname,
-            child.find('line').text,
-            child.find('type').text,
-            child.find('code').text,
-            child.find('desc').text
-        )
+        else:
+            try:
+                adjustedFname = os.path.relpath(fname,basepath).replace("\\","/")
+            except:
+                adjustedFname = fname.replace("\\","/")
 
         # add the directory name to the filename
         #    this assumes that the input.xml filnames are
         #    relative to the directory of the input file
-        msg.file = os.path.join(directoryName,msg.file)
+        return os.path.join(directoryName,adjustedFname)
 
-        if msg.category == "supplemental":
-            last_primary_msg.supplementals.append(msg)
-        else:
-            last_primary_msg = msg
-            msgs.append(msg)
+    return adjust_file
 
-    return msgs
+def iter_msgs(filename, basepath):
+    """Streams the messages of a PC-lint Plus XML file without caching them"""
+    return build_msgs(iter_raw_msgs(filename), make_file_adjuster(filename, basepath))
 
-# HTML summary output
-class FileSummary:
-    def __init__(self, filename):
-        self.msg_count = 0
-        self.error_count = 0
-        self.warning_count = 0
-        self.info_count = 0
-        self.note_count = 0
-        self.supplemental_count = 0
-        self.misra_count = 0
-        self.filename = filename
-
-def summarize_files(msgs):
-    file_summaries = dict()
-    for msg in msgs:
-        msg.file = msg.file.replace("\\","/")
+def parse_msgs(filename, cache = True):
 
-        if msg.file not in file_summaries:
-            file_summaries[msg.file] = FileSummary(msg.file)
+    basepath = get_basepath()
 
-        file_summary = file_summaries[msg.file]
+    os.environ['VCAST_RPTS_CUSTOM_CSS']= basepath + "/vc_scripts/css/tooltip.css"
 
-        if msg.category == 'error':
-            file_summary.error_count += 1
-        elif msg.category == 'warning':
-            file_summary.warning_count += 1
-        elif msg.category == 'info':
-            file_summary.info_count += 1
-        elif msg.category == 'note':
-            file_summary.note_count += 1
-        elif msg.category == 'supplemental':
-            file_summary.supplemental_count += 1
+    return load_msgs(filename, make_file_adjuster(filename, basepath), cache)
 
-        if msg.category != 'supplemental':
-            file_summary.msg_count += 1
+# HTML summary output
 
-        if 'MISRA' in msg.text:
-            file_summary.misra_count += 1
+def summarize_files(msgs):
+    for msg in msgs:
+        msg.file = msg.file.replace("\\","/")
 
-    return file_summaries
+    return pclp_messages.summarize_files(msgs)
 
 def build_html_table(column_headers, data_source, row_generator):
     out = ""
@@ -235,6 +180,77 @@ def generate_summaries():
 
     return out
 
+# source files are rendered in worker processes when there are at least this many
+SOURCE_PARALLEL_MIN_FILES = 8
+
+def index_msgs_by_file_and_line(msgs):
+    """{file: {line: [(category, number, text), ...]}} of the primary messages"""
+    index = {}
+    for msg in msgs:
+        index.setdefault(msg.file, {}).setdefault(msg.line, []).append((msg.category, msg.number, msg.text))
+    return index
+
+def render_source_file(job):
+    """
+    HTML for one source file with its messages shown as tooltips.  Returns
+    None if the file is not in the current source tree.
+    """
+    fname, filename_anchor, messages_by_line = job
+
+    srcname = fname
+    if os.path.isfile(fname + ".vcast.bak"):
+        srcname = fname + ".vcast.bak"
+    elif not os.path.isfile(fname):
+        return None
+
+    with open(srcname, 'rb') as fh:
+        # read and replace the line ending for consistency
+        contents = fh.read().decode(encFmt, "replace")
+    contents = contents.replace("\r\n", "\n").replace("\r","\n")
+
+    parts = []
+    parts.append("<h4 id=\"" + filename_anchor + "\">Coverage for " + escape(fname) + "</h4>\n")
+    parts.append("<pre class=\"aggregate-coverage\">\n")
+
+    for lineno, line in enumerate(contents.splitlines(), start=1):
+        lineno_str = str(lineno)
+        lineno_str_justified = lineno_str.ljust(6)
+        esc_line = escape(line)
+
+        line_msgs = messages_by_line.get(lineno_str, None)
+        if line_msgs:
+            tooltip = "<br>".join(category + " " + str(number) + " " + escape(text) for category, number, text in line_msgs)
+            anchor =  filename_anchor + "_" + lineno_str
+            parts.append("<div id=\"" + anchor + "\" class=\"tooltip\">")
+            parts.append("<span class=\"na-cvg\">")
+            parts.append(lineno_str_justified + " <span class=\"tooltiptext\"> " + tooltip + "</span>" + esc_line)
+            parts.append("</span>")
+            parts.append("</div>\n")
+        else:
+            parts.append("<span class=\"na-cvg\">" + lineno_str_justified + " " +  esc_line + "</span>\n")
+
+    parts.append("</pre>")
+
+    return "".join(parts)
+
+def render_source_files(jobs):
+    import multiprocessing
+    if len(jobs) < SOURCE_PARALLEL_MIN_FILES or multiprocessing.cpu_count() < 2:
+        return [render_source_file(job) for job in jobs]
+
+    workers = min(multiprocessing.cpu_count(), len(jobs))
+    try:
+        pool = multiprocessing.Pool(workers)
+    except (OSError, ImportError, NotImplementedError) as e:
+        print("  Unable to render PC-lint Plus source files in parallel ({})...rendering serially".format(e))
+        return [render_source_file(job) for job in jobs]
+
+    try:
+        return pool.map(render_source_file, jobs, chunksize=max(1, len(jobs) // (4 * workers)))
+    finally:
+        pool.close()
+        pool.join()
+
 def generate_source():
 
     if not checkVectorCASTVersion(21, True):
@@ -243,88 +259,42 @@ def generate_source():
         print("XXX If you'd like to see the Source Code section of the PC-Line Report, please upgrade VectorCAST")
         sys.exit(0)
 
-    fullMpName = globalState.fullMpName
     msgs = globalState.msgs
 
-    output = "<h4>No Source Infomation avialable</h4>"
-
     file_summaries = summarize_files(msgs)
 
-    filenames = []
     filenames = sorted(
         (file.filename for file in file_summaries.values()),
         key=lambda f: os.path.basename(f).lower()
     )
 
-    filename_dict = {file.filename.replace("\\","/").lower(): file.filename for file in file_summaries.values()}
+    # every message of every line, not just the first one
+    messages_by_file_and_line = index_msgs_by_file_and_line(msgs)
 
-    # Use a lambda inside map to create a dictionary keyed by file and then by line
-    messages_by_file_and_line = {}
+    jobs = []
+    for fname in filenames:
+        filename_anchor = fname.replace("\\","_").replace("/","_").replace(".","_")
+        jobs.append((fname, filename_anchor, messages_by_file_and_line.get(fname, {})))
 
-    # Group by file
-    list(map(lambda msg: messages_by_file_and_line.setdefault(msg.file, {})
-             .setdefault(msg.line, msg), msgs))
+    fragments = render_source_files(jobs)
 
+    output = ["<h4>No Source Infomation avialable</h4>"]
     listOfContent = []
-    for filename in filenames: #localUnits:
-
-        filename = filename.replace("\\","/")
-        base_fname = os.path.basename(filename)
-        adjustedFname = filename.lower()
-
-        fname = filename_dict[adjustedFname]
-        orig_fname = fname;
-
-        basename = os.path.basename(fname)
-
-        filename_anchor = orig_fname.replace("\\","_").replace("/","_").replace(".","_")
-
-        content = {
-            "title": basename,
-            "link" : filename_anchor
-        }
-
-        listOfContent.append(content)
-
-        output += "<h4 id=\"" + filename_anchor + "\">Coverage for " + escape(fname) + "</h4>\n"
-        output += "<pre class=\"aggregate-coverage\">\n"
-
-        if not os.path.isfile(fname) and not os.path.isfile(fname + ".vcast.bak"):
+    for (fname, filename_anchor, messages_by_line), fragment in zip(jobs, fragments):
+        if fragment is None:
             sys.stderr.write(fname + " not found in the current source tree...skipping\n")
-            return
+            continue
 
-        if os.path.isfile(fname + ".vcast.bak"):
-            fname = fname + ".vcast.bak"
-
-        with open(fname, 'rb') as fh:
-            # read and replace the line ending for consistency
-            contents = fh.read().encode(encFmnt, "replace")
-            contents = contents.replace("\r\n", "\n").replace("\r","\n")
-            for lineno, line in enumerate(contents.splitlines(), start=1):
-                lineno_str = str(lineno)
-                lineno_str_justified = str(lineno).ljust(6)
-                esc_line = escape(line)
-
-                if lineno_str in messages_by_file_and_line[orig_fname].keys():
-                    msg = messages_by_file_and_line[orig_fname][lineno_str]
-                    esc_msg_text = escape(msg.text)
-                    tooltip = msg.category + " " + str(msg.number) + " " + esc_msg_text
-                    anchor =  filename_anchor + "_" + lineno_str
-                    output += "<div id=\"" + anchor + "\" class=\"tooltip\">"
-                    output += "<span class=\"na-cvg\">"
-                    output += lineno_str_justified + " <span class=\"tooltiptext\"> " + tooltip + "</span>" + esc_line
-                    output += "</span>"
-                    output += "</div>"
-                else:
-                    output += "<span class=\"na-cvg\">" + lineno_str_justified + " " +  esc_line + "</span>"
-
-                output += "\n"
-
-            output += "</pre>"
+        listOfContent.append({
+            "title": os.path.basename(fname),
+            "link" : filename_anchor
+        })
+        output.append(fragment)
 
-    return output, listOfContent
+    return "".join(output), listOfContent
 
-def generate_html_report(mpName, input_xml, output_html):
+def generate_html_report(mpName, input_xml, output_html, msgs = None):
+    """HTML report of input_xml - pass msgs if they have already been parsed"""
 
     if not os.path.exists(input_xml):
         print("{} was not found. Skipping PCLP HTML reporting".format(input_xml))
@@ -333,8 +303,11 @@ def generate_html_report(mpName, input_xml, output_html):
     from vector.apps.DataAPI.vcproject_api import VCProjectApi
     from vector.apps.ReportBuilder.custom_report import CustomReport
 
+    if msgs is None:
+        msgs = parse_msgs(input_xml)
+
     globalState.fullMpName = mpName
-    globalState.msgs = parse_msgs(input_xml)
+    globalState.msgs = msgs
 
     if output_html is None:
         output_html = "pclp_findings.html"
@@ -392,137 +365,56 @@ def emit_html(msgs):
     out += "</html>\n"
     return out
 
-# Text output
+# Baseline
 
-def text_format_msg(msg):
-    out = ""
-    if (msg.file and msg.file != "") or (msg.line and msg.line != '0'):
-        out += msg.file + " " + str(msg.line) + " "
-    out += msg.category + " " + str(msg.number) + ": "
-    out += msg.text + "\n"
-    for supplemental in msg.supplementals:
-        out += text_format_msg(supplemental)
-    return out
+def generate_delta_reports(msgs, baseline = None, save_baseline = None, output_delta_json = None, output_delta_gitlab = None):
+    """
+    Compares msgs to the findings saved in baseline and writes the new/fixed
+    findings to the delta reports.  Without a baseline every finding is new.
+    """
+    previous = read_baseline(baseline) if baseline else None
+    if previous is None:
+        if baseline:
+            print("PC-lint Plus baseline {} not found...reporting all findings as new".format(baseline))
+        previous = {}
 
-def emit_text(msgs):
-    out = ""
-    for msg in msgs:
-        out += text_format_msg(msg)
-    return out
+    diff = BaselineDiff(msgs, previous)
+    print("PC-lint Plus findings: {} new, {} fixed, {} unchanged".format(len(diff.new), len(diff.fixed), diff.unchanged))
 
-# JSON output
-
-def json_transform_key(k):
-    if k == 'number':
-        k = 'msgno'
-    return k
-
-def json_should_include_item(k,v):
-    return bool(v) and v != "0"
-
-def json_serialize_msg(msg):
-    items = {json_transform_key(k):v for k, v in msg.__dict__.items() if json_should_include_item(k,v)}
-    return items
-
-def emit_json(msgs):
-    return json.dumps(msgs, default=json_serialize_msg, sort_keys=True, indent=4)
-
-
-def gitlab_serialize_msg(msg):
-
-    fname = None
-    lineno = None
-    findingNum = None
-    findingDesc = None
-
-    import hashlib
-    fingerprint = hashlib.md5((msg.line + msg.category + msg.number + msg.text).encode('utf-8')).hexdigest()
-
-    items = {}
-    items["type"] = "issue"
-    items["fingerprint"] = fingerprint
-
-    for key, value in msg.__dict__.items():
-        if key == "category":
-            if value == 'error':
-                items["severity"] = 'critical'
-            elif value == 'warning':
-                items["severity"] = 'minor'
-            elif value == 'info' or value == 'note':
-                items["severity"] = 'info'
-            else:
-                return {}
-
-        if key == "number":
-            findingNum = value
-
-        if key == "text":
-            findingDesc = value.split("[")[0].strip()
-
-        if key == "file":
-            fname = value
-        elif key == "line":
-            lineno = value
-
-        if findingNum is not None and findingDesc is not None:
-            outStr = ""
-            count = 0
-            for part in findingDesc.split("'"):
-               if (count % 2) == 0:
-                  outStr += part.strip()  + " "
-               count += 1
-
-            items["check_name"] = findingNum + " " + outStr.strip()
-            items["description"] = findingNum + ": " + value
-            findingDesc = None
-            findingNum = None
-
-        if fname is not None and lineno is not None:
-            items['location'] = {}
-            items['location']['path'] = fname.replace("\\","/")
-            items['location']['lines'] = {}
-            items['location']['lines']['begin'] = lineno
-            fname = None
-            lineno = None
-
-    return_items = {}
-    return_items['description'] = items['description']
-    return_items['check_name'] = items['check_name'].replace(" ","-")
-    return_items['fingerprint'] = items['fingerprint']
-    return_items['severity'] = items['severity']
-    return_items['location'] = {}
-    return_items['location']['path'] = items['location']['path']
-    return_items['location']['lines'] = {}
-    return_items['location']['lines']['begin'] = int(items['location']['lines']['begin'])
-
-
-    return return_items
-
-def emit_gitlab(msgs):
-    return json.dumps(msgs, default=gitlab_serialize_msg, indent=2)
+    if output_delta_json:
+        write_output(emit_delta_json(diff), output_delta_json)
+    if output_delta_gitlab:
+        write_chunks(iter_gitlab(diff.new), output_delta_gitlab)
+    if save_baseline:
+        write_baseline(diff.index, save_baseline)
 
-# Driver
+    return diff
 
-def write_output(output, filename):
-    with open(filename, 'wb') as file:
-        file.write(output.encode(encFmt, "replace"))
+# Driver
 
-def generate_reports(input_xml, output_text = None, output_html = None, output_json = None, output_gitlab = None, full_mp_name = None):
+def generate_reports(input_xml, output_text = None, output_html = None, output_json = None, output_gitlab = None, full_mp_name = None,
+                     baseline = None, save_baseline = None, output_delta_json = None, output_delta_gitlab = None):
     
     if not os.path.exists(input_xml):
         print("{} was not found. Skipping PCLP reporting".format(input_xml))
         return
 
+    # parsed once for every report - the HTML report lists the messages in
+    # XML order, the others sorted by file and line
     msgs = parse_msgs(input_xml)
-    msgs.sort(key=lambda msg: (msg.file == "", msg.file, int(msg.line) if msg.line != "" else 0))
+    sorted_msgs = sorted(msgs, key=lambda msg: (msg.file == "", msg.file, int(msg.line) if msg.line != "" else 0))
     if output_text:
-        write_output(emit_text(msgs), output_text)
-    if output_html:
-        generate_html_report(full_mp_name, input_xml, output_html)
+        write_chunks(iter_text(sorted_msgs), output_text)
     if output_json:
-        write_output(emit_json(msgs), output_json)
+        write_chunks(iter_json(sorted_msgs), output_json)
     if output_gitlab:
-        write_output(emit_gitlab(msgs), output_gitlab)
+        write_chunks(iter_gitlab(sorted_msgs), output_gitlab)
+    if baseline or save_baseline or output_delta_json or output_delta_gitlab:
+        generate_delta_reports(sorted_msgs, baseline, save_baseline, output_delta_json, output_delta_gitlab)
+    del sorted_msgs
+    if output_html:
+        # last, since the HTML source section normalizes msg.file
+        generate_html_report(full_mp_name, input_xml, output_html, msgs)
 
 def main():
     parser = argparse.ArgumentParser(description='Generate HTML, JSON, or text output from PC-lint Plus XML reports (XML reports are produced by running PC-lint Plus with env-xml.lnt)')
@@ -534,17 +426,23 @@ def main():
     parser.add_argument('--output-text', action='store', help=argparse.SUPPRESS, default = None, required=False)
     parser.add_argument('--output-json', action='store', help=argparse.SUPPRESS, default = None, required=False)
     parser.add_argument('--output-gitlab', action='store', help=argparse.SUPPRESS, default = None, required=False)
+    parser.add_argument('--baseline', action='store', help='Fingerprint index of the previous findings to compare against', default = None, required=False)
+    parser.add_argument('--save-baseline', action='store', help='Save the fingerprint index of the current findings for the next run', default = None, required=False)
+    parser.add_argument('--output-delta-json', action='store', help='JSON output of the new and fixed findings since --baseline', default = None, required=False)
+    parser.add_argument('--output-delta-gitlab', action='store', help='GitLab codequality output of the new findings since --baseline', default = None, required=False)
     parser.add_argument('-g', '--gen-lint-xml-cmd', action='store', help=argparse.SUPPRESS, dest="gen_lint_xml_cmd", default = None, required=False)
     args = parser.parse_args()
     if args.gen_lint_xml_cmd is not None:
         subprocess.run(args.gen_lint_xml_cmd)
 
-    if not (args.output_text or args.output_html or args.output_json or args.output_gitlab):
+    if not (args.output_text or args.output_html or args.output_json or args.output_gitlab or
+            args.save_baseline or args.output_delta_json or args.output_delta_gitlab):
         parser.error("please specify one or more outputs using the '--output-<FORMAT>=<FILENAME>' options")
 
     args.full_mp_name = os.path.abspath(args.full_mp_name)
 
-    generate_reports(input_xml = args.input_xml, output_text = args.output_text, output_html=args.output_html,   output_json=args.output_json,   output_gitlab=args.output_gitlab, full_mp_name = args.full_mp_name)
+    generate_reports(input_xml = args.input_xml, output_text = args.output_text, output_html=args.output_html,   output_json=args.output_json,   output_gitlab=args.output_gitlab, full_mp_name = args.full_mp_name,
+                     baseline = args.baseline, save_baseline = args.save_baseline, output_delta_json = args.output_delta_json, output_delta_gitlab = args.output_delta_gitlab)
 
     ## if opened from VectorCAST GUI...
     if (args.full_mp_name is not None) and (args.output_html is not None) and (os.getenv('VCAST_PROG_STARTED_FROM_GUI') == "true"):
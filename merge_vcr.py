@@ -2,9 +2,14 @@ import sys
 import sqlite3
 import os, shutil
 import zipfile, glob
+import copy, struct, tempfile
+import multiprocessing
 from pprint import pprint
 import argparse
 
+ZIP_LOCAL_HEADER_SIZE = 30
+ZIP_DATA_DESCRIPTOR_FLAG = 0x08
+
 def mergeNewResultsIntoOrigDb(origVcrFile, newVcrFile, outputVcrFile, cursor_new, cursor_orig, table_name, del_old_table = False, verbose = False):
     '''
     This function merges the content of a specific table from an old cursor into a new cursor. 
@@ -15,49 +20,225 @@ def mergeNewResultsIntoOrigDb(origVcrFile, newVcrFile, outputVcrFile, cursor_new
     :return: None
     '''
 
+    replaceResultRows(cursor_new, cursor_orig, table_name, verbose)
+
+    if (cursor_orig.connection.commit() == None):
+        # With Ephemeral RAM connections & testing, deleting the table may be ill-advised
+        s = "[INFO] Test results  : merged from %s to %s" % (newVcrFile, outputVcrFile)
+        print(s) # Consider logging.info()
+        
+    return None
+
+def replaceResultRows(cursor_new, cursor_orig, table_name, verbose = False):
+    '''
+    Replaces the rows in cursor_orig's table with cursor_new's rows for every
+    (testsuite_id, environment) found in cursor_new.  Does not commit.
+    '''
+
     # dynamically determine SQL expression requirements
     s = "PRAGMA table_info(%s)" % (table_name)
-    column_names = cursor_new.execute(s).fetchall()
-    column_names = tuple([str(x[1]) for x in column_names][1:])  # remove the primary keyword
+    table_info = cursor_new.execute(s).fetchall()
+    column_names = tuple([str(x[1]) for x in table_info][1:])  # remove the primary keyword
+    column_types = tuple([str(x[2]) for x in table_info][1:])
     values_placeholders = ', '.join(['?' for x in column_names])  # format appropriately
     
     # SQL select columns from table
     s = "SELECT %s FROM %s" % (', '.join(column_names), table_name)	
-    orig_data = cursor_orig.execute(s).fetchall()
     new_data  = cursor_new.execute(s).fetchall()
 
-    filtered_new_data = []
-    rowsToRemove = []
-    for new_row in new_data:
-        new_testsuite_id = new_row[0]
-        new_env_name     = new_row[1]
-        for orig_row in orig_data:
-            orig_testsuite_id = orig_row[0]
-            orig_env_name     = orig_row[1]
+    # rows are keyed on (testsuite_id, environment) - the first two non-key columns
+    key_columns = column_names[:2]
+    s = "SELECT DISTINCT %s FROM %s" % (', '.join(key_columns), table_name)
+    orig_keys = set(cursor_orig.execute(s).fetchall())
+    new_keys = set((row[0], row[1]) for row in new_data)
+    keys_to_replace = sorted(new_keys & orig_keys, key=lambda key: (str(key[0]), str(key[1])))
+
+    if verbose:
+        for testsuite_id, env_name in keys_to_replace:
+            print("   need to replace contents of " + str(testsuite_id) + "/" + str(env_name) + " in orig_dbx ")
+
+    # replace the results in one transaction, deleting via an indexed temp table of keys
+    try:
+        cursor_orig.execute("DROP TABLE IF EXISTS temp.merge_keys")
+        # same column types as the table so the key index can be used for the lookup
+        cursor_orig.execute("CREATE TEMP TABLE merge_keys (k0 %s, k1 %s, PRIMARY KEY (k0, k1))" % column_types[:2])
+        cursor_orig.executemany("INSERT INTO temp.merge_keys VALUES (?, ?)", keys_to_replace)
+
+        s = "DELETE FROM %s WHERE EXISTS (SELECT 1 FROM temp.merge_keys WHERE k0 = %s.%s AND k1 = %s.%s)" % \
+            (table_name, table_name, key_columns[0], table_name, key_columns[1])
+        cursor_orig.execute(s)
+        cursor_orig.execute("DROP TABLE temp.merge_keys")
+
+        s = "INSERT INTO %s (%s) VALUES (%s)" % (table_name, ', '.join(column_names), values_placeholders)
+        cursor_orig.executemany(s, new_data)
+    except:
+        cursor_orig.connection.rollback()
+        raise
+
+def findVcrDatabases(names):
+    # top level .db members: the results database and the cover database
+    dbName = None
+    coverDbName = None
+    for name in names:
+        if "/" in name or not name.endswith(".db"):
+            continue
+        if "_cover" in name:
+            coverDbName = name
+        else:
+            dbName = name
+    return dbName, coverDbName
+
+def copyZipMemberRaw(src, dst, info):
+    """
+    Copies a member from one zip to another without decompressing and
+    recompressing it.  Falls back to a normal copy if the zipfile internals
+    needed for the raw copy are not available.
+    """
+    try:
+        src.fp.seek(info.header_offset)
+        header = src.fp.read(ZIP_LOCAL_HEADER_SIZE)
+        nameLen, extraLen = struct.unpack("<HH", header[26:30])
+        src.fp.seek(info.header_offset + ZIP_LOCAL_HEADER_SIZE + nameLen + extraLen)
+
+        zinfo = copy.copy(info)
+        # sizes and CRC go in the local header, so no data descriptor follows the data
+        zinfo.flag_bits &= ~ZIP_DATA_DESCRIPTOR_FLAG
+        zinfo.header_offset = dst.fp.tell()
+        dst.fp.write(zinfo.FileHeader(zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT))
+
+        remaining = info.compress_size
+        while remaining > 0:
+            chunk = src.fp.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                raise IOError("Unexpected end of " + src.filename)
+            dst.fp.write(chunk)
+            remaining -= len(chunk)
+
+        dst.filelist.append(zinfo)
+        dst.NameToInfo[zinfo.filename] = zinfo
+        dst.start_dir = dst.fp.tell()
+        dst._didModify = True
+    except AttributeError:
+        with src.open(info) as fin:
+            with dst.open(info, "w") as fout:
+                shutil.copyfileobj(fin, fout, 1024 * 1024)
+
+def prepareNewVcr(job):
+    """
+    Worker for merge_many: extracts the databases of one new .vcr and plans
+    its cover database updates against the original cover database.
+    """
+    import update_cover_db_project_files
+    from contextlib import closing
+    from pathlib import Path
+
+    index, newVcrFile, tempDir, origCoverDbPath = job
+
+    newDir = os.path.join(tempDir, "new%d" % index)
+    with zipfile.ZipFile(newVcrFile, 'r') as newZip:
+        newDbName, newCoverDbName = findVcrDatabases(newZip.namelist())
+        newZip.extract(newDbName, newDir)
+        newZip.extract(newCoverDbName, newDir)
+
+    newCoverDbPath = os.path.join(newDir, newCoverDbName)
+    with closing(update_cover_db_project_files.connect_read_only(Path(origCoverDbPath))) as r1, \
+         closing(update_cover_db_project_files.connect_read_only(Path(newCoverDbPath))) as r2:
+        update_cover_db_project_files.validate_schema(r1, "path")
+        update_cover_db_project_files.validate_schema(r2, "path")
+        plans = update_cover_db_project_files.plan_updates(r1, r2, path_column="path", case_sensitive=False, include_unchanged=True)[0]
+
+    return os.path.join(newDir, newDbName), plans
+
+def merge_many(origVcrFile, newVcrFiles, outputVcrFile, verbose = False, jobs = None):
+    """
+    Merges the results of several new .vcr files into the original .vcr and
+    writes the merged .vcr once.
+
+    The new files are applied in order, so a later file wins for results of
+    the same testsuite/environment, the same as merging them one at a time.
+    Extracting the new databases and planning their cover database updates
+    runs in worker processes.  The result tables and the cover database are
+    then updated in one transaction each.  Only the databases are extracted to
+    a temp directory.  Every other member of the original .vcr is copied to the
+    output as is (still compressed) and only the merged databases are
+    recompressed.
+    """
+    import update_cover_db_project_files
+
+    tempDir = tempfile.mkdtemp(prefix="merge_vcr_")
+    tempOutput = outputVcrFile + ".tmp"
+    try:
+        origDir = os.path.join(tempDir, "orig")
+        with zipfile.ZipFile(origVcrFile, 'r') as origZip:
+            origDbName, origCoverDbName = findVcrDatabases(origZip.namelist())
+            origZip.extract(origDbName, origDir)
+            origZip.extract(origCoverDbName, origDir)
+
+        origDbPath = os.path.join(origDir, origDbName)
+        origCoverDbPath = os.path.join(origDir, origCoverDbName)
+
+        work = [(index, newVcrFile, tempDir, origCoverDbPath) for index, newVcrFile in enumerate(newVcrFiles)]
+        if jobs is None:
+            jobs = multiprocessing.cpu_count()
+        jobs = max(1, min(jobs, len(work)))
+        if jobs > 1:
+            pool = multiprocessing.Pool(jobs)
+            try:
+                prepared = pool.map(prepareNewVcr, work)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            prepared = [prepareNewVcr(job) for job in work]
+
+        # result tables - all of the new results in one transaction
+        orig_db = sqlite3.connect(origDbPath)
+        orig_cursor = orig_db.cursor()
+        for newVcrFile, (newDbPath, plans) in zip(newVcrFiles, prepared):
+            new_db = sqlite3.connect(newDbPath)
+            new_cursor = new_db.cursor()
+            replaceResultRows(new_cursor, orig_cursor, "result", verbose)
+            new_cursor.close()
+            new_db.close()
+        orig_db.commit()
+        orig_cursor.close()
+        orig_db.close()
+
+        s = "[INFO] Test results  : merged from %s to %s" % (", ".join(newVcrFiles), outputVcrFile)
+        print(s) # Consider logging.info()
+
+        # update cover dbx
+        coverPlans = update_cover_db_project_files.combine_plans([plans for newDbPath, plans in prepared])
+        if coverPlans:
+            updated = update_cover_db_project_files.apply_updates(update_cover_db_project_files.Path(origCoverDbPath), coverPlans)
             if verbose:
-                tf = new_testsuite_id == orig_testsuite_id and orig_env_name == new_env_name
-                print (str(new_testsuite_id) + " == " + str(orig_testsuite_id)  + " and " + orig_env_name + " == " + new_env_name + ": " + str(tf))
-            if new_testsuite_id == orig_testsuite_id and orig_env_name == new_env_name:
-                if verbose:
-                    print("   need to replace contents of " + str(orig_testsuite_id) + "/" + orig_env_name + " in orig_dbx ")
-                    s = "   DELETE FROM %s WHERE testsuite_id=%s and environment=%s" % (table_name, new_testsuite_id, new_env_name)
-                    print(s)
-                rowsToRemove.append(new_row)
-                s = "DELETE FROM %s WHERE testsuite_id=%s and environment=\"%s\"" % (table_name, new_testsuite_id, new_env_name)
-                cursor_orig.execute(s)
-                cursor_orig.connection.commit()
-                break
-                
-    s = "INSERT INTO %s %s VALUES (%s)" % (table_name, column_names, values_placeholders)
-    cursor_orig.executemany(s, new_data)
-    if (cursor_orig.connection.commit() == None):
-        # With Ephemeral RAM connections & testing, deleting the table may be ill-advised
-        s = "[INFO] Test results  : merged from %s to %s" % (newVcrFile, outputVcrFile)
+                print("Updated {} project_files row(s) in {}".format(updated, origCoverDbName))
+
+        s = "[INFO] Cover database: merged from %s to %s" % (", ".join(newVcrFiles), outputVcrFile)
         print(s) # Consider logging.info()
-        
-    return None
 
-def run(origVcrFile, newVcrFile, outputVcrFile, verbose, keep):
+        modified = {origDbName : origDbPath, origCoverDbName : origCoverDbPath}
+        with zipfile.ZipFile(origVcrFile, 'r') as origZip:
+            with zipfile.ZipFile(tempOutput, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as outZip:
+                for info in origZip.infolist():
+                    if info.filename in modified:
+                        outZip.write(modified[info.filename], info.filename)
+                    else:
+                        copyZipMemberRaw(origZip, outZip, info)
+
+        if os.path.exists(outputVcrFile):
+            os.remove(outputVcrFile)
+        os.rename(tempOutput, outputVcrFile)
+    finally:
+        if os.path.exists(tempOutput):
+            os.remove(tempOutput)
+        shutil.rmtree(tempDir, ignore_errors=True)
+
+def run(origVcrFile, newVcrFile, outputVcrFile, verbose, keep, stream = True):
+
+    if stream:
+        merge_many(origVcrFile, [newVcrFile], outputVcrFile, verbose)
+        return
 
     try:
         os.makedirs("newVcr")
@@ -124,16 +305,24 @@ if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
     parser.add_argument('--orig', action='store', type=str,  help='Original Result Filename', dest="origVcrFile")
-    parser.add_argument('--new',  action='store', type=str,  help='New Result Filename', dest="newVcrFile")
+    parser.add_argument('--new',  action='store', type=str,  help='New Result Filename. Use a comma separated list to merge several result files at once', dest="newVcrFile")
     parser.add_argument('--out',  action='store', type=str,  help='Output .vcr file name', dest="outputVcrFile", default="merged.vcr")
     parser.add_argument('--keep', action='store_true', help='Keep the original .vcr files',  default = False)
+    parser.add_argument('--jobs', action='store', type=int, help='Number of processes used to prepare the new result files (default = # of CPUs)', default = None)
+    parser.add_argument('--extract', action='store_true', help='Extract both .vcr files to the working directory and rebuild the output .vcr from scratch', default = False)
     
     parser.add_argument('-v', '--verbose',  action="store_true",  help='Verbose output', dest="verbose", default=False)
 
     args = parser.parse_args()
     
-    if os.path.isfile(args.newVcrFile):
+    newVcrFiles = [f for f in args.newVcrFile.split(",") if f]
+
+    if len(newVcrFiles) > 1 and not args.extract:
+        if all(os.path.isfile(f) for f in newVcrFiles) and os.path.isfile(args.origVcrFile):
+            merge_many(args.origVcrFile, newVcrFiles, args.outputVcrFile, args.verbose, args.jobs)
+
+    elif os.path.isfile(args.newVcrFile):
         if os.path.isfile(args.origVcrFile):
-            run(args.origVcrFile, args.newVcrFile, args.outputVcrFile, args.verbose, args.keep)
+            run(args.origVcrFile, args.newVcrFile, args.outputVcrFile, args.verbose, args.keep, not args.extract)
             
     
@@ -0,0 +1,570 @@
+#
+# The MIT License
+#
+# Copyright 2026 Vector Informatik, GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+# pclp_messages.py - PC-lint Plus messages shared by generate_pclp_reports and
+#                    generate_sonarqube_pclp_reports
+#
+# The XML is streamed into raw message tuples that are written to an on-disk
+# cache next to the input as they go by, keyed by the SHA-256 of the XML, so the
+# next report reads the cache instead of parsing the XML again.  The cache is
+# plain JSON lines so reading a planted cache file cannot run code.  Each report
+# builds its own Message objects from the stream with its own file name mapping.
+
+import gc
+import io
+import os
+import json
+import json.encoder
+import hashlib
+import xml.etree.ElementTree
+
+from contextlib import contextmanager
+
+try:
+    from safe_open import open
+except:
+    pass
+
+from vcast_utils import getVectorCASTEncoding, replaceFile
+
+encFmt = getVectorCASTEncoding()
+
+CACHE_SUFFIX = ".msgs.cache"
+CACHE_VERSION = 2
+BASELINE_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# PC-lint Plus message representation and parsing
+
+class Message(object):
+    # findings from whole-program runs can number in the millions
+    __slots__ = ("file", "line", "category", "number", "text", "supplementals")
+
+    def __init__(self, file, line, category, number, text):
+        self.file = file if file is not None else ''
+        self.line = line
+        self.category = category
+        self.number = number
+        self.text = text
+        self.supplementals = []
+
+def msg_items(msg):
+    return [(name, getattr(msg, name)) for name in Message.__slots__]
+
+class XmlTextStream(object):
+    """
+    File-like reader that decodes the PC-lint Plus XML in chunks and drops
+    anything before the first '<'
+    """
+    def __init__(self, fd):
+        self.stream = io.TextIOWrapper(fd, encoding=encFmt, errors="replace", newline="")
+        self.started = False
+
+    def read(self, size = -1):
+        data = self.stream.read(size)
+        while not self.started and data:
+            index = data.find('<')
+            if index != -1:
+                self.started = True
+                return data[index:]
+            data = self.stream.read(size)
+        return data
+
+def iter_raw_msgs(filename):
+    """
+    Streams the messages out of a PC-lint Plus XML file as
+    (file, line, category, number, text, supplementals) tuples, with the
+    <file> text as it appears in the XML.
+
+    Each message element is cleared once it has been read, so memory use
+    does not depend on the size of the XML.  Supplemental messages are
+    attached to the preceding primary message, which is yielded once the
+    next primary message (or the end of the file) is reached.
+    """
+    last_primary_msg = None
+    depth = 0
+    root = None
+
+    with open(filename, "rb") as fd:
+        for event, elem in xml.etree.ElementTree.iterparse(XmlTextStream(fd), events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth != 1:
+                continue
+
+            fields = {}
+            for field in elem:
+                fields.setdefault(field.tag, field.text)
+            root.clear()
+
+            msg = (
+                fields.get('file'),
+                fields.get('line'),
+                fields.get('type'),
+                fields.get('code'),
+                fields.get('desc'),
+                []
+            )
+
+            if msg[2] == "supplemental" and last_primary_msg is not None:
+                last_primary_msg[5].append(msg[:5])
+            else:
+                if last_primary_msg is not None:
+                    yield last_primary_msg
+                last_primary_msg = msg
+
+    if last_primary_msg is not None:
+        yield last_primary_msg
+
+def hash_file(filename):
+    sha = hashlib.sha256()
+    with open(filename, "rb") as fd:
+        while True:
+            chunk = fd.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha.update(chunk)
+    return sha.hexdigest()
+
+class CacheError(ValueError):
+    """The cache file has the right header but a line that cannot be read"""
+    pass
+
+def cache_raw_msg(row):
+    """Raw message tuple from a cache line's JSON array"""
+    try:
+        file, line, category, number, text, supplementals = json.loads(row.decode("utf-8"))
+        return (file, line, category, number, text, [tuple(supplemental) for supplemental in supplementals])
+    except (ValueError, TypeError) as e:
+        raise CacheError(str(e))
+
+def open_cache(cache_file, digest):
+    """
+    cache_file positioned after its JSON header line, or None if it is
+    missing, stale or unreadable
+    """
+    try:
+        fd = io.open(cache_file, "rb")
+    except (IOError, OSError):
+        return None
+    try:
+        header = json.loads(fd.readline().decode("utf-8"))
+        if header == {"version" : CACHE_VERSION, "sha256" : digest}:
+            return fd
+    except Exception:
+        pass
+    fd.close()
+    return None
+
+class CacheWriter(object):
+    """Writes the cache one message at a time and moves it into place once complete"""
+    def __init__(self, cache_file, digest):
+        self.cache_file = cache_file
+        self.tmpPath = "{}.{}.tmp".format(cache_file, os.getpid())
+        self.fd = None
+        try:
+            self.fd = io.open(self.tmpPath, "wb")
+            self.fd.write((json.dumps({"version" : CACHE_VERSION, "sha256" : digest}) + "\n").encode("utf-8"))
+        except (IOError, OSError) as e:
+            self.failed(e)
+
+    def failed(self, e):
+        print("  Unable to write PC-lint Plus message cache {}: {}".format(self.cache_file, e))
+        self.discard()
+
+    def write(self, raw):
+        if self.fd is None:
+            return
+        try:
+            self.fd.write((json.dumps(raw, separators=(",", ":")) + "\n").encode("utf-8"))
+        except (IOError, OSError) as e:
+            self.failed(e)
+
+    def commit(self):
+        if self.fd is None:
+            return
+        try:
+            self.fd.close()
+            self.fd = None
+            replaceFile(self.tmpPath, self.cache_file)
+        except (IOError, OSError) as e:
+            self.failed(e)
+
+    def discard(self):
+        if self.fd is not None:
+            self.fd.close()
+            self.fd = None
+        if os.path.exists(self.tmpPath):
+            os.remove(self.tmpPath)
+
+@contextmanager
+def gc_paused():
+    """
+    Millions of small tuples and Message objects trigger the cyclic garbage
+    collector over and over while they are built - none of them form cycles
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def iter_cached_raw_msgs(filename, cache = True):
+    """
+    Streams the raw messages of a PC-lint Plus XML file: from the cache file
+    while the XML's hash has not changed, otherwise from the XML, writing the
+    cache as they go by.  Nothing is kept once it has been yielded.
+    """
+    if not cache:
+        for raw in iter_raw_msgs(filename):
+            yield raw
+        return
+
+    digest = hash_file(filename)
+    cache_file = filename + CACHE_SUFFIX
+
+    fd = open_cache(cache_file, digest)
+    if fd is not None:
+        with fd:
+            for line in fd:
+                yield cache_raw_msg(line)
+        return
+
+    writer = CacheWriter(cache_file, digest)
+    try:
+        for raw in iter_raw_msgs(filename):
+            writer.write(raw)
+            yield raw
+        writer.commit()
+    finally:
+        writer.discard()
+
+def make_msg(raw, adjust_file):
+    file, line, category, number, text = raw[:5]
+    return Message(adjust_file(file), line, category, number, text)
+
+def build_msgs(raws, adjust_file):
+    """Message objects for raw messages, with adjust_file applied once per distinct <file> text"""
+    files = {}
+    def adjusted(file):
+        try:
+            return files[file]
+        except KeyError:
+            value = files[file] = adjust_file(file)
+            return value
+
+    for raw in raws:
+        msg = make_msg(raw, adjusted)
+        msg.supplementals = [make_msg(supplemental, adjusted) for supplemental in raw[5]]
+        yield msg
+
+def load_msgs(filename, adjust_file, cache = True):
+    """All the Message objects of a PC-lint Plus XML file"""
+    with gc_paused():
+        try:
+            return list(build_msgs(iter_cached_raw_msgs(filename, cache), adjust_file))
+        except CacheError as e:
+            cache_file = filename + CACHE_SUFFIX
+            print("  Ignoring PC-lint Plus message cache {}: {}".format(cache_file, e))
+            try:
+                os.remove(cache_file)
+            except (IOError, OSError):
+                cache = False
+            return list(build_msgs(iter_cached_raw_msgs(filename, cache), adjust_file))
+
+# File summaries
+
+class FileSummary:
+    def __init__(self, filename):
+        self.msg_count = 0
+        self.error_count = 0
+        self.warning_count = 0
+        self.info_count = 0
+        self.note_count = 0
+        self.supplemental_count = 0
+        self.misra_count = 0
+        self.filename = filename
+
+def summarize_files(msgs):
+    file_summaries = dict()
+    for msg in msgs:
+        if msg.file not in file_summaries:
+            file_summaries[msg.file] = FileSummary(msg.file)
+
+        file_summary = file_summaries[msg.file]
+
+        if msg.category == 'error':
+            file_summary.error_count += 1
+        elif msg.category == 'warning':
+            file_summary.warning_count += 1
+        elif msg.category == 'info':
+            file_summary.info_count += 1
+        elif msg.category == 'note':
+            file_summary.note_count += 1
+        elif msg.category == 'supplemental':
+            file_summary.supplemental_count += 1
+
+        if msg.category != 'supplemental':
+            file_summary.msg_count += 1
+
+        if 'MISRA' in msg.text:
+            file_summary.misra_count += 1
+
+    return file_summaries
+
+# Text output
+
+def text_format_msg(msg):
+    out = ""
+    if (msg.file and msg.file != "") or (msg.line and msg.line != '0'):
+        out += msg.file + " " + str(msg.line) + " "
+    out += msg.category + " " + str(msg.number) + ": "
+    out += msg.text + "\n"
+    for supplemental in msg.supplementals:
+        out += text_format_msg(supplemental)
+    return out
+
+def iter_text(msgs):
+    for msg in msgs:
+        yield text_format_msg(msg)
+
+def emit_text(msgs):
+    return "".join(iter_text(msgs))
+
+# JSON output
+#
+# The reports are written one message at a time.  Each element is laid out
+# exactly as json.dumps() of the whole list with the same indent would.
+
+def iter_json_list(elements, indent):
+    """Chunks of the JSON list of the already serialized elements"""
+    prefix = "\n" + " " * indent
+    separator = "["
+    for element in elements:
+        yield separator + prefix + element.replace("\n", prefix)
+        separator = ","
+    yield "[]" if separator == "[" else "\n]"
+
+def json_transform_key(k):
+    if k == 'number':
+        k = 'msgno'
+    return k
+
+def json_should_include_item(k,v):
+    return bool(v) and v != "0"
+
+def json_serialize_msg(msg):
+    items = {json_transform_key(k):v for k, v in msg_items(msg) if json_should_include_item(k,v)}
+    return items
+
+# what json.dumps() writes for a str (ensure_ascii)
+json_quote = json.encoder.encode_basestring_ascii
+
+def json_format_value(value, level):
+    """value (a str, Message or list of Messages) laid out as json.dumps(..., indent=4) would at the given depth"""
+    if isinstance(value, str):
+        return json_quote(value)
+
+    inner = "\n" + "    " * (level + 1)
+    outer = "\n" + "    " * level
+
+    if isinstance(value, list):
+        if not value:
+            return "[]"
+        return "[" + inner + ("," + inner).join([json_format_value(item, level + 1) for item in value]) + outer + "]"
+
+    if isinstance(value, Message):
+        items = json_serialize_msg(value)
+        if not items:
+            return "{}"
+        return "{" + inner + ("," + inner).join([
+            json_quote(k) + ": " + json_format_value(items[k], level + 1) for k in sorted(items)]) + outer + "}"
+
+    return json.dumps(value)
+
+def iter_json(msgs):
+    # same layout as json.dumps(msgs, default=json_serialize_msg, sort_keys=True, indent=4)
+    return iter_json_list((json_format_value(msg, 0) for msg in msgs), 4)
+
+def emit_json(msgs):
+    return "".join(iter_json(msgs))
+
+GITLAB_SEVERITY = {
+    'error'   : 'critical',
+    'warning' : 'minor',
+    'info'    : 'info',
+    'note'    : 'info',
+}
+
+GITLAB_ISSUE = """{{
+  "description": {description},
+  "check_name": {check_name},
+  "fingerprint": {fingerprint},
+  "severity": {severity},
+  "location": {{
+    "path": {path},
+    "lines": {{
+      "begin": {begin}
+    }}
+  }}
+}}"""
+
+def gitlab_fingerprint(msg):
+    return hashlib.md5((msg.line + msg.category + msg.number + msg.text).encode('utf-8')).hexdigest()
+
+def gitlab_check_name(msg):
+    # number followed by the description up to the first '[', leaving out the quoted parts
+    findingDesc = msg.text.split("[")[0].strip()
+    outStr = ""
+    for part in findingDesc.split("'")[::2]:
+        outStr += part.strip()  + " "
+    return (msg.number + " " + outStr.strip()).replace(" ","-")
+
+def gitlab_serialize_msg(msg, fingerprint = None):
+
+    if fingerprint is None:
+        fingerprint = gitlab_fingerprint(msg)
+
+    severity = GITLAB_SEVERITY.get(msg.category, None)
+    if severity is None:
+        return {}
+
+    return_items = {}
+    return_items['description'] = msg.number + ": " + msg.text
+    return_items['check_name'] = gitlab_check_name(msg)
+    return_items['fingerprint'] = fingerprint
+    return_items['severity'] = severity
+    return_items['location'] = {}
+    return_items['location']['path'] = msg.file.replace("\\","/")
+    return_items['location']['lines'] = {}
+    return_items['location']['lines']['begin'] = int(msg.line)
+
+    return return_items
+
+def gitlab_format_msg(msg, fingerprint = None):
+    """The GitLab issue for msg as json.dumps(..., indent=2) would write it"""
+    issue = gitlab_serialize_msg(msg, fingerprint)
+    if not issue:
+        return "{}"
+    return GITLAB_ISSUE.format(
+        description = json_quote(issue['description']),
+        check_name = json_quote(issue['check_name']),
+        fingerprint = json_quote(issue['fingerprint']),
+        severity = json_quote(issue['severity']),
+        path = json_quote(issue['location']['path']),
+        begin = issue['location']['lines']['begin'])
+
+def iter_gitlab(msgs):
+    return iter_json_list((gitlab_format_msg(msg) for msg in msgs), 2)
+
+def emit_gitlab(msgs):
+    return "".join(iter_gitlab(msgs))
+
+# Baselines
+#
+# A baseline is the compact fingerprint index of a previous run's findings:
+#   {"version": 1, "files": {path: {fingerprint: [line, category, number]}}}
+# The GitLab fingerprint does not cover the file, so findings are keyed by
+# (path, fingerprint).  It does cover the line, so a finding that moved is
+# reported as both new and fixed.
+
+def baseline_key(msg):
+    return (msg.file.replace("\\","/"), gitlab_fingerprint(msg))
+
+def baseline_index(msgs, keys):
+    """{(path, fingerprint): [line, category, number]} of msgs and their baseline keys"""
+    return {key: [msg.line, msg.category, msg.number] for msg, key in zip(msgs, keys)}
+
+def read_baseline(filename):
+    """The baseline index saved in filename, or None if there is none"""
+    if not os.path.isfile(filename):
+        return None
+    with open(filename, "rb") as fd:
+        data = json.loads(fd.read().decode("utf-8"))
+    if data.get("version", None) != BASELINE_VERSION:
+        raise ValueError("{} is not a version {} PC-lint Plus baseline".format(filename, BASELINE_VERSION))
+    return {(path, fingerprint): entry
+            for path, findings in data["files"].items()
+            for fingerprint, entry in findings.items()}
+
+def write_baseline(index, filename):
+    files = {}
+    for (path, fingerprint), entry in index.items():
+        files.setdefault(path, {})[fingerprint] = entry
+    data = json.dumps({"version" : BASELINE_VERSION, "files" : files}, sort_keys=True, separators=(",", ":"))
+
+    tmpPath = "{}.{}.tmp".format(filename, os.getpid())
+    try:
+        with open(tmpPath, "wb") as fd:
+            fd.write(data.encode("utf-8"))
+        replaceFile(tmpPath, filename)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+class BaselineDiff(object):
+    """Findings of the current run compared to a baseline"""
+    def __init__(self, msgs, baseline):
+        keys = [baseline_key(msg) for msg in msgs]
+        self.index = baseline_index(msgs, keys)
+
+        current_keys = set(self.index)
+        baseline_keys = set(baseline)
+        new_keys = current_keys - baseline_keys
+        fixed_keys = baseline_keys - current_keys
+
+        self.new = [msg for msg, key in zip(msgs, keys) if key in new_keys]
+        self.fixed = [(key, baseline[key]) for key in sorted(fixed_keys)]
+        self.unchanged = len(msgs) - len(self.new)
+
+def json_serialize_fixed(fixed):
+    (path, fingerprint), (line, category, number) = fixed
+    return {"path" : path, "fingerprint" : fingerprint, "line" : line, "category" : category, "number" : number}
+
+def emit_delta_json(diff):
+    delta = {
+        "new" : diff.new,
+        "fixed" : [json_serialize_fixed(fixed) for fixed in diff.fixed],
+        "unchanged" : diff.unchanged,
+    }
+    return json.dumps(delta, default=json_serialize_msg, sort_keys=True, indent=4)
+
+# Report files
+
+def write_output(output, filename):
+    with open(filename, 'wb') as file:
+        file.write(output.encode(encFmt, "replace"))
+
+def write_chunks(chunks, filename):
+    """Writes the report one chunk at a time instead of building it in memory first"""
+    with open(filename, 'wb') as file:
+        for chunk in chunks:
+            file.write(chunk.encode(encFmt, "replace"))
@@ -22,7 +22,7 @@
 # THE SOFTWARE.
 #
 
-import sys, os, subprocess, argparse, glob, shutil
+import sys, os, subprocess, argparse, glob, shutil, json, io, signal
 from pprint import pprint
 import time
 from datetime import timedelta
@@ -32,6 +32,11 @@ import incremental_build_report_aggregator
 
 from vcast_utils import getVectorCASTEncoding
 
+try:
+    from check_build_log import BuildLogScanner
+except:
+    BuildLogScanner = None
+
 try:
     from vector.apps.DataAPI.vcproject_api import VCProjectApi 
     from vector.apps.DataAPI.vcproject_models import VCProject
@@ -42,7 +47,7 @@ try:
 except:
     from vector.apps.DataAPI.api import Api as UnitTestApi
 
-from threading import Thread, Lock
+from threading import Thread, Lock, Condition
 try:
     from Queue import Queue, Empty
 except ImportError:
@@ -54,16 +59,280 @@ except:
 
 VCD = os.environ['VECTORCAST_DIR']
 MONITOR_SLEEP=6
+PROGRESS_HEARTBEAT=60
+PROGRESS_SLOWEST=3
+LOG_CHUNK_SIZE=1024*1024
+
+JOB_PASSED="passed"
+JOB_UNSTABLE="unstable"
+JOB_FAILED="failed"
+JOB_SKIPPED="skipped"
+JOB_TERMINATED="terminated"
+JOB_CANCELLED="cancelled"
+HISTORY_ALPHA=0.5
+SYSTEM_TEST_RESOURCE="system_test"
 
 VERSION="v0.79"
 VERSION_DATE="2025-10-29"
 
+class JobHistory(object):
+    """
+    Run time history for each environment kept as an exponentially weighted
+    moving average (EWMA) of the seconds taken to build/execute.
+    
+    File format (json):
+        { "version" : 1, "alpha" : 0.5, "runtimes" : { "compiler/testsuite/env" : seconds, ... } }
+    """
+    def __init__(self, filename, alpha = HISTORY_ALPHA):
+        self.filename = filename
+        self.alpha = alpha
+        self.runtimes = {}
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.filename):
+            return
+        try:
+            with open(self.filename, "rb") as fd:
+                data = json.loads(fd.read().decode("utf-8", "replace"))
+            for name, seconds in data.get("runtimes", {}).items():
+                self.runtimes[name] = float(seconds)
+        except Exception as e:
+            print("Unable to read job history file {}: {}".format(self.filename, e))
+            self.runtimes = {}
+
+    def estimate(self, full_name):
+        return self.runtimes.get(full_name, None)
+
+    def update(self, full_name, seconds):
+        previous = self.runtimes.get(full_name, None)
+        if previous is None:
+            self.runtimes[full_name] = float(seconds)
+        else:
+            self.runtimes[full_name] = self.alpha * seconds + (1.0 - self.alpha) * previous
+
+    def save(self):
+        data = {"version" : 1, "alpha" : self.alpha, "runtimes" : self.runtimes}
+        try:
+            with open(self.filename, "wb") as fd:
+                fd.write(json.dumps(data, indent=2, sort_keys=True).encode("utf-8"))
+        except Exception as e:
+            print("Unable to write job history file {}: {}".format(self.filename, e))
+
+class ResourceManager(object):
+    """
+    Counted resources shared between environment jobs (hardware targets, ports, directories...)
+    
+    A job acquires all of its resources at once or waits until they are all available,
+    so jobs needing overlapping resources can not deadlock each other.  Resources not
+    listed in the capacities default to a capacity of 1.
+    """
+    def __init__(self, capacities = None):
+        self.capacities = dict(capacities) if capacities else {}
+        self.in_use = {}
+        self.condition = Condition()
+
+    def capacity(self, name):
+        return self.capacities.get(name, 1)
+
+    def available(self, names):
+        for name in names:
+            if self.in_use.get(name, 0) >= self.capacity(name):
+                return False
+        return True
+
+    def acquire_first(self, candidates):
+        """
+        Waits until all the resources of at least one candidate list are available,
+        acquires them and returns that candidate's index - earlier candidates win
+        """
+        self.condition.acquire()
+        try:
+            while True:
+                for index, names in enumerate(candidates):
+                    if self.available(names):
+                        for name in names:
+                            self.in_use[name] = self.in_use.get(name, 0) + 1
+                        return index
+                self.condition.wait()
+        finally:
+            self.condition.release()
+
+    def release(self, names):
+        if not names:
+            return
+        self.condition.acquire()
+        try:
+            for name in names:
+                self.in_use[name] -= 1
+            self.condition.notify_all()
+        finally:
+            self.condition.release()
+
+class ProgressReporter(object):
+    """
+    Progress of the parallel build/execute driven by job start/finish events.
+    
+    Reports completed/total, throughput, ETA (from the job history or the average
+    of the completed jobs) and the slowest running jobs.  Each event is printed as
+    a compact console line and, when an event file is given, appended as a JSON
+    line so CI dashboards can tail it.
+    """
+    def __init__(self, job_names, slots, history = None, event_file = None):
+        self.waiting = set(job_names)
+        self.total = len(self.waiting)
+        self.slots = max(int(slots), 1)
+        self.history = history
+        self.completed = 0
+        self.running = {}
+        self.durations = []
+        self.start_time = time.time()
+        self.condition = Condition()
+        self.event_fd = None
+        if event_file:
+            self.event_fd = io.open(event_file, "wb")
+
+    def close(self):
+        if self.event_fd:
+            self.event_fd.close()
+            self.event_fd = None
+
+    def estimate(self, full_name):
+        seconds = None
+        if self.history:
+            seconds = self.history.estimate(full_name)
+        if seconds is None and self.durations:
+            seconds = sum(self.durations) / len(self.durations)
+        return seconds
+
+    def eta(self, now):
+        remaining = 0.0
+        for full_name in self.running:
+            seconds = self.estimate(full_name)
+            if seconds is None:
+                return None
+            remaining += max(seconds - (now - self.running[full_name]), 0.0)
+        for full_name in self.waiting:
+            seconds = self.estimate(full_name)
+            if seconds is None:
+                return None
+            remaining += seconds
+        jobs_left = len(self.running) + len(self.waiting)
+        return remaining / max(min(self.slots, jobs_left), 1)
+
+    def slowest(self, now):
+        in_flight = sorted(self.running.items(), key=lambda item: item[1])
+        return [(name, now - start) for name, start in in_flight[:PROGRESS_SLOWEST]]
+
+    def status(self):
+        now = time.time()
+        elapsed = now - self.start_time
+        if elapsed > 0:
+            throughput = self.completed * 60.0 / elapsed
+        else:
+            throughput = 0.0
+        eta = self.eta(now)
+        return {
+            "completed" : self.completed,
+            "total" : self.total,
+            "running" : len(self.running),
+            "waiting" : len(self.waiting),
+            "elapsed" : round(elapsed, 1),
+            "jobs_per_min" : round(throughput, 2),
+            "eta" : eta if eta is None else round(eta, 1),
+            "slowest" : [[name, round(seconds, 1)] for name, seconds in self.slowest(now)],
+        }
+
+    def format_status(self, status):
+        if status["total"] > 0:
+            pct = 100 * status["completed"] // status["total"]
+        else:
+            pct = 100
+        if status["eta"] is None:
+            eta = "unknown"
+        else:
+            eta = str(timedelta(seconds=int(status["eta"])))
+        line = "Progress: {}/{} complete ({}%), {} running, {} waiting, {} jobs/min, ETA {}".format(
+            status["completed"], status["total"], pct, status["running"], status["waiting"], status["jobs_per_min"], eta)
+        if status["slowest"]:
+            line += ", slowest: " + ", ".join("{} ({})".format(name, timedelta(seconds=int(seconds))) for name, seconds in status["slowest"])
+        return line
+
+    def write_event(self, event, full_name = None, echo = True, **kwargs):
+        # caller holds self.condition
+        status = self.status()
+        if echo:
+            print(self.format_status(status))
+        if self.event_fd:
+            record = {"time" : round(time.time(), 3), "event" : event}
+            if full_name:
+                record["job"] = full_name
+            record.update(kwargs)
+            record.update(status)
+            self.event_fd.write((json.dumps(record, sort_keys=True) + "\n").encode("utf-8"))
+            self.event_fd.flush()
+
+    def job_started(self, full_name):
+        self.condition.acquire()
+        try:
+            self.waiting.discard(full_name)
+            self.running[full_name] = time.time()
+            self.write_event("start", full_name, echo = False)
+        finally:
+            self.condition.release()
+
+    def job_finished(self, full_name, **kwargs):
+        self.condition.acquire()
+        try:
+            start = self.running.pop(full_name, time.time())
+            seconds = time.time() - start
+            self.durations.append(seconds)
+            self.completed += 1
+            self.write_event("finish", full_name, seconds = round(seconds, 1), **kwargs)
+            self.condition.notify_all()
+        finally:
+            self.condition.release()
+
+    def job_cancelled(self, full_name):
+        self.condition.acquire()
+        try:
+            self.waiting.discard(full_name)
+            self.completed += 1
+            self.write_event("cancel", full_name, echo = False)
+            self.condition.notify_all()
+        finally:
+            self.condition.release()
+
+    def heartbeat(self):
+        self.condition.acquire()
+        try:
+            self.write_event("progress")
+        finally:
+            self.condition.release()
+
+    def wait_done(self, timeout):
+        self.condition.acquire()
+        try:
+            if self.completed < self.total:
+                self.condition.wait(timeout)
+            return self.completed >= self.total
+        finally:
+            self.condition.release()
+
 class ParallelExecute(object):
     def __init__(self):
         self.manageProject = None
         self.jobs = "1"
         self.dryrun = False
         self.tc_order = False
+        self.lpt_order = False
+        self.history = None
+        self.resource_config = {}
+        self.progress = None
+        self.progress_file = None
+        self.build_log_scan = None
+        self.fail_fast = 0
+        self.aborted = False
         self.prioritize = []
         self.use_ci = ""
         self.compiler = None
@@ -85,7 +354,13 @@ class ParallelExecute(object):
         parser.add_argument('--verbose',     help='Dry Run without build/execute', action="store_true",default=False)
         parser.add_argument('--jobs', '-j',     help='Number of concurrent jobs (default = 1)', default="1")
         parser.add_argument('--prioritize', '-pr', help='Comma separated list of environments to add to front of the que', default=None)
-        parser.add_argument('--tc_order', '-tc', help='Add environments to que based on # of testcases', action="store_true", default=False)
+        orderGroup = parser.add_mutually_exclusive_group()
+        orderGroup.add_argument('--tc_order', '-tc', help='Add environments to que based on # of testcases', action="store_true", default=False)
+        orderGroup.add_argument('--lpt_order', '-lpt', help='Add environments to que longest first based on historical run times. Environments without history are estimated by # of testcases', action="store_true", default=False)
+        parser.add_argument('--history_file', help='Job run time history file (default = <project>_job_history.json)', default=None)
+        parser.add_argument('--resource_file', help='JSON file with resource capacities and environment resource lists used to limit concurrent system test environments', default=None)
+        parser.add_argument('--progress_file', help='JSON lines file for job start/finish/progress events (default = no event file)', default=None)
+        parser.add_argument('--fail_fast', help='Stop starting environments and terminate running jobs after this many failed environments (default = 1 when given without a value)', nargs='?', type=int, const=1, default=0)
         parser.add_argument('--use_ci', help='Use continuous integration licenses', action="store_true", default=False)
         parser.add_argument('--vcast_action', help = 'Choose the VectorCAST Action (default = build-execute)', choices = ['build', 'execute', 'build-execute'], default = 'build-execute')
         args = parser.parse_args()
@@ -103,6 +378,8 @@ class ParallelExecute(object):
             
         self.dryrun = args.dryrun
         self.tc_order = args.tc_order
+        self.lpt_order = args.lpt_order
+        self.fail_fast = args.fail_fast
         
         self.vcast_action = args.vcast_action
 
@@ -140,14 +417,31 @@ class ParallelExecute(object):
             
         self.currently_executing_jobs = []
         self.jobs_run_time = {}
+        self.jobs_run_seconds = {}
+        self.job_status = {}
+        self.failed_jobs = []
+        self.terminated_jobs = set()
+        self.running_processes = {}
+        self.waiting_envs = {}
         self.script_start_time = time.time()
 
         self.running_jobs = 0
         self.lock = Lock()
-        self.system_test_lock = Lock()
+        
+        if args.resource_file:
+            with open(args.resource_file, "rb") as fd:
+                self.resource_config = json.loads(fd.read().decode("utf-8", "replace"))
+        self.resources = ResourceManager(self.resource_config.get("capacities", {}))
         self.mpName = self.manageProject.replace(".vcm","")
         self.mpName = os.path.basename(self.mpName)
         
+        if args.history_file:
+            self.history = JobHistory(args.history_file)
+        else:
+            self.history = JobHistory(self.mpName + "_job_history.json")
+            
+        self.progress_file = args.progress_file
+        
     def th_Print (self, str):
         self.lock.acquire()
         print (str)
@@ -159,18 +453,69 @@ class ParallelExecute(object):
     def th_lock_release(self):
         self.lock.release()
         
-    def run_env(self, env_in, queue, exec_queue, is_system_test):
-        
-        if is_system_test:
-            self.system_test_lock.acquire()
-            
+    def classify_job(self, returncode, scanner, first_line):
+        # "Environment built Successfully" is missing from runs that only re-execute,
+        # so it only changes the verbose message and never fails the job
+        if first_line and b"Creating report in" in first_line:
+            return JOB_SKIPPED
+        if returncode != 0:
+            return JOB_FAILED
+        if scanner and scanner.found_fail:
+            return JOB_FAILED
+        if scanner and scanner.found_unstable:
+            return JOB_UNSTABLE
+        return JOB_PASSED
+
+    def terminate_process(self, process):
+        # the manage command runs under a shell, so take down the whole process tree
+        try:
+            if os.name == "nt":
+                with open(os.devnull, "wb") as devnull:
+                    subprocess.call("taskkill /F /T /PID " + str(process.pid), shell=True, stdout=devnull, stderr=devnull)
+            else:
+                os.killpg(process.pid, signal.SIGTERM)
+        except Exception as e:
+            self.th_Print("Unable to terminate job (pid {}): {}".format(process.pid, e))
+
+    def record_failure(self, full_name):
         self.th_lock_acquire()
-        self.running_jobs += 1
+        self.failed_jobs.append(full_name)
+        abort = self.fail_fast > 0 and len(self.failed_jobs) >= self.fail_fast and not self.aborted
+        if abort:
+            self.aborted = True
+            processes = list(self.running_processes.items())
+            for name, process in processes:
+                if name not in self.failed_jobs:
+                    self.terminated_jobs.add(name)
         self.th_lock_release()
-        
+
+        if abort:
+            self.th_Print("\nFail fast: {} failed environment(s). Not starting any more environments and terminating {} running job(s)".format(len(self.failed_jobs), len(processes)))
+            for name, process in processes:
+                self.terminate_process(process)
+
+    def run_env(self, env_in, queue, exec_queue, resources):
+        # the job slot and resources were taken by run_compiler
+            
         compiler, testsuite, env = env_in.split()
         level = compiler + "/" + testsuite
         full_name = "/".join([compiler, testsuite, env])
+
+        if self.aborted:
+            self.resources.release(resources)
+            exec_queue.get()
+            queue.task_done()
+            self.th_lock_acquire()
+            self.currently_executing_jobs.remove(full_name)
+            self.job_status[full_name] = JOB_CANCELLED
+            self.th_lock_release()
+            self.progress.job_cancelled(full_name)
+            return
+
+        self.th_lock_acquire()
+        self.running_jobs += 1
+        self.th_lock_release()
+        
         exec_cmd = VCD + "/manage --project " + self.manageProject + self.use_ci + \
             " --" + self.vcast_action + " " + self.incremental + " --level " + level + \
             " --environment " + env + \
@@ -179,14 +524,60 @@ class ParallelExecute(object):
 
         log_name = ".".join(["build",compiler, testsuite, env,"log"])
         
+        self.progress.job_started(full_name)
+
+        status = JOB_PASSED
+        terminated = False
+        built_ok = False
         with open(log_name, "wb") as build_log:  # 'wb' is safest across OSes
             start_time = time.time()
 
             if not self.dryrun:
                 if self.verbose:
                     print("\nStarting an environment job for {} environment.\nExec Command:\n\t{}".format(env, exec_cmd))
-                process = subprocess.Popen(exec_cmd, shell=True, stdout=build_log, stderr=build_log)
+                    
+                if os.name == "nt":
+                    process = subprocess.Popen(exec_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                        creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+                else:
+                    process = subprocess.Popen(exec_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                        preexec_fn=os.setsid)
+                        
+                self.th_lock_acquire()
+                self.running_processes[full_name] = process
+                self.th_lock_release()
+
+                # copy the output to the build log, matching the build log phrases as it goes
+                scanner = BuildLogScanner(self.encFmt) if BuildLogScanner else None
+                first_line = None
+                for raw in iter(process.stdout.readline, b""):
+                    build_log.write(raw)
+                    if first_line is None:
+                        first_line = raw
+                    if not built_ok and b"Environment built Successfully" in raw:
+                        built_ok = True
+                    if scanner:
+                        scanner.feed(raw)
+                        if scanner.found_fail and status != JOB_FAILED:
+                            status = JOB_FAILED
+                            self.record_failure(full_name)
+                process.stdout.close()
                 process.wait()
+                if scanner:
+                    scanner.close()
+                
+                self.th_lock_acquire()
+                del self.running_processes[full_name]
+                terminated = full_name in self.terminated_jobs
+                self.th_lock_release()
+                
+                if terminated:
+                    status = JOB_TERMINATED
+                elif status != JOB_FAILED:
+                    classification = self.classify_job(process.returncode, scanner, first_line)
+                    if classification == JOB_FAILED and status != JOB_FAILED:
+                        self.record_failure(full_name)
+                    status = classification
             else:
                 msg = "RUN>> " + (exec_cmd if self.verbose else full_name)
                 self.th_Print(msg)
@@ -194,18 +585,23 @@ class ParallelExecute(object):
             end_time = time.time()
             human_uptime = str(timedelta(seconds=int(end_time - start_time)))
             self.jobs_run_time[full_name] = human_uptime
+            # skipped and failed runs say nothing about how long a real run takes
+            if not self.dryrun and status in [JOB_PASSED, JOB_UNSTABLE]:
+                self.jobs_run_seconds[full_name] = end_time - start_time
 
+        self.job_status[full_name] = status
 
         if self.verbose:
-            with open(log_name, 'rb') as bldlog:
-                data = bldlog.read().decode('utf-8','replace')
-
-                if "Creating report in" in data.split('\n')[0]:    
-                    print("\nRebuild/Reexecute unnecessary for {} environment. Run Time was  {}.".format(env, human_uptime))
-                elif "Environment built Successfully" not in data:
-                    print("\nERROR!!! Environment {} not built successfully!  See {} for more details".format(env,log_name))
-                else:
-                    print("\nCompleted execution of {} environment. Run Time was {}.".format(env, human_uptime))
+            if status == JOB_SKIPPED:
+                print("\nRebuild/Reexecute unnecessary for {} environment. Run Time was  {}.".format(env, human_uptime))
+            elif status == JOB_TERMINATED:
+                print("\nTerminated execution of {} environment. Run Time was {}.".format(env, human_uptime))
+            elif status == JOB_FAILED or not built_ok:
+                print("\nERROR!!! Environment {} not built successfully!  See {} for more details".format(env,log_name))
+            else:
+                print("\nCompleted execution of {} environment. Run Time was {}.".format(env, human_uptime))
+        elif status == JOB_FAILED:
+            self.th_Print("ERROR!!! Environment {} failed. See {} for more details".format(full_name, log_name))
         
         #print ("Harness Loading/Execution {} Complete".format(full_name))
         exec_queue.get()
@@ -219,26 +615,42 @@ class ParallelExecute(object):
         self.running_jobs -= 1
         self.th_lock_release()
         
-        if is_system_test:
-            self.system_test_lock.release()
+        self.resources.release(resources)
+        
+        self.progress.job_finished(full_name, status = status)
 
     def run_compiler(self, compiler, max, queue, compiler_queue):
         compiler_queue.get()
         
         parallel_exec_queue = Queue(maxsize=max)
         
+        # each free job slot goes to the first waiting environment whose resources are
+        # all free, so an environment waiting on a busy resource never holds a slot
+        waiting = self.waiting_envs[compiler] = []
         while not queue.empty():
-            q_entry =  queue.get()
-            env = q_entry[0]
-            isSystemTest = q_entry[1]
-            
-            parallel_exec_queue.put(env)
+            waiting.append(queue.get())
+        
+        while waiting:
+            if self.aborted:
+                # fail fast - drain the queue without starting anything else
+                env = waiting.pop(0)[0]
+                full_name = "/".join(env.split())
+                self.th_lock_acquire()
+                self.job_status[full_name] = JOB_CANCELLED
+                self.th_lock_release()
+                self.progress.job_cancelled(full_name)
+                queue.task_done()
+                continue
+                
+            parallel_exec_queue.put(compiler)
+            index = self.resources.acquire_first([q_entry[1] for q_entry in waiting])
+            env, resources = waiting.pop(index)
 
             self.th_lock_acquire()
             self.currently_executing_jobs.append("/".join(env.split()))
             self.th_lock_release()
 
-            t = Thread(target=self.run_env, args=[env, queue, parallel_exec_queue, isSystemTest])
+            t = Thread(target=self.run_env, args=[env, queue, parallel_exec_queue, resources])
             t.daemon = True # thread dies with the program
             t.start()
 
@@ -249,21 +661,29 @@ class ParallelExecute(object):
         
         compiler_queue.task_done()
     
+    def print_running_jobs(self):
+        self.th_lock_acquire()
+        si = sorted(self.currently_executing_jobs)
+        self.th_lock_release()
+
+        print ("\n\nWaiting on jobs ({} {})".format(self.running_jobs , len(si)))
+        print ("===============\n  ")
+        print ("  " + "\n  ".join(si))
+        
+        for compiler in self.waiting_execution_queue:
+            qsz = len(self.waiting_envs.get(compiler, []))
+            if qsz > 0:
+                print ("  >> {} has {} environment(s) in queue".format(compiler, qsz))
+
     def monitor_jobs(self):
         
-        while self.running_jobs != 0:
-            print ("\n\nWaiting on jobs ({} {})".format(self.running_jobs , len(self.currently_executing_jobs)))
-            print ("===============\n  ")
-            si = self.currently_executing_jobs
-            si.sort()
-            print ("  " + "\n  ".join(si))
-            
-            for compiler in self.waiting_execution_queue:
-                qsz = self.waiting_execution_queue[compiler].qsize()
-                if qsz > 0:
-                    print ("  >> {} has {} environment(s) in queue".format(compiler, qsz))
-            
-            time.sleep(MONITOR_SLEEP)
+        last_heartbeat = time.time()
+        while not self.progress.wait_done(MONITOR_SLEEP):
+            if time.time() - last_heartbeat >= PROGRESS_HEARTBEAT:
+                last_heartbeat = time.time()
+                self.progress.heartbeat()
+                if self.verbose:
+                    self.print_running_jobs()
 
         print ("\n\n  Waiting for jobs to finalize...\n\n")
         self.compiler_exec_queue.join()
@@ -279,7 +699,17 @@ class ParallelExecute(object):
         print (    "=============================")
         print ("  Total time : {}".format(script_human_uptime))
         for job in self.jobs_run_time:
-            print ("  {} {}".format(self.jobs_run_time[job], job))
+            print ("  {} {} ({})".format(self.jobs_run_time[job], job, self.job_status.get(job, JOB_PASSED)))
+            
+        if self.failed_jobs:
+            print ("\n  Failed environments : {}".format(len(self.failed_jobs)))
+            for job in sorted(self.failed_jobs):
+                print ("    " + job)
+        if self.aborted:
+            cancelled = [job for job in self.job_status if self.job_status[job] in [JOB_CANCELLED, JOB_TERMINATED]]
+            print ("\n  Fail fast stopped {} environment(s)".format(len(cancelled)))
+            
+        self.progress.close()
 
     def get_testcase_list(self,env_list):
         new_env_list = []
@@ -293,13 +723,83 @@ class ParallelExecute(object):
         print("\n")
         return new_env_list
 
+    def get_lpt_list(self, env_list):
+        # longest processing time first - start the longest jobs early to minimize the total run time
+        sized_env_list = []
+        known_seconds = 0.0
+        known_testcases = 0
+        for env in env_list:
+            full_name = "/".join([env.compiler.name, env.testsuite.name, env.name])
+            testcases = self.get_testcase_count(env)
+            seconds = self.history.estimate(full_name)
+            if seconds is not None:
+                known_seconds += seconds
+                known_testcases += testcases + 1
+            sized_env_list.append([env, testcases, seconds])
+
+        # environments without history get estimated by the average run time per testcase
+        if known_testcases > 0:
+            seconds_per_testcase = known_seconds / known_testcases
+        else:
+            seconds_per_testcase = 1.0
+
+        for item in sized_env_list:
+            if item[2] is None:
+                item[2] = (item[1] + 1) * seconds_per_testcase
+                item.append("estimated")
+            else:
+                item.append("history")
+
+        new_env_list = []
+        print("\nSorted Environment List (longest first):\n")
+        for i in sorted(sized_env_list, key=lambda item: item[2], reverse=True):
+            print("    Env Name: " + i[0].name + ",\t\tRun Time: " + str(timedelta(seconds=int(i[2]))) + " (" + i[3] + ")")
+            new_env_list.append(i[0])
+        print("\n")
+        return new_env_list
+
+    def update_history(self):
+        if self.dryrun:
+            return
+        for full_name in self.jobs_run_seconds:
+            self.history.update(full_name, self.jobs_run_seconds[full_name])
+        self.history.save()
+
+    def get_env_resources(self, env):
+        # resources come from VCAST_PARALLEL_RESOURCES=res1,res2 in the C_DEFINE_LIST
+        # and/or the "environments" section of the --resource_file
+        resources = []
+        
+        def_list = env.options['enums']['C_DEFINE_LIST'][0]
+        if "VCAST_PARALLEL_RESOURCES" in def_list:
+            for item in def_list.split():
+                if "VCAST_PARALLEL_RESOURCES" in item:
+                    resources += [r for r in item.split("=")[-1].split(",") if r]
+        
+        env_config = self.resource_config.get("environments", {})
+        full_name = "/".join([env.compiler.name, env.testsuite.name, env.name])
+        for key in [full_name, env.name]:
+            if key in env_config:
+                resources += env_config[key]
+                break
+        
+        # system test environments without any declared resources are serialized like before
+        if not resources and env.system_tests:
+            resources = [SYSTEM_TEST_RESOURCE]
+            
+        return sorted(set(resources))
+
     def get_testcase_count(self, env):
         count=0
+        test_file = None
         for efile in env.file_list:
             if '.tst' in efile:
                 test_file = efile
                 break
                 
+        if test_file is None or not os.path.isfile(test_file):
+            return count
+
         with open(test_file, 'rb') as tst:
             for raw in tst:  # each iteration reads the next line
                 line = raw.decode(self.encFmt, 'replace')
@@ -312,18 +812,32 @@ class ParallelExecute(object):
                 
         print ("\n\n")
         
-        build_log_data = ""
-
-        for file in glob.glob("build*.log"):
-            with open(file, "rb") as fd:
-                # read as bytes, then decode manually - works in Py2 and Py3
-                build_log_data += fd.read().decode(self.encFmt, "replace")
-                
-            if not self.verbose:
-                os.remove(file)
-            
-        with open(self.mpName + "_build.log","wb") as fd: 
-            fd.write(build_log_data.encode(self.encFmt, "replace"))
+        build_log_name = self.mpName + "_build.log"
+
+        # build.<compiler>.<testsuite>.<env>.log in compiler/testsuite/env order
+        log_list = [f for f in glob.glob("build*.log") if f != build_log_name]
+        log_list.sort(key=lambda f: f.split(".")[1:-1])
+
+        if BuildLogScanner:
+            self.build_log_scan = BuildLogScanner(self.encFmt)
+
+        # stream the logs straight through as bytes, scanning for build log phrases on the way
+        with open(build_log_name,"wb") as fd: 
+            for file in log_list:
+                with open(file, "rb") as log_fd:
+                    while True:
+                        chunk = log_fd.read(LOG_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        fd.write(chunk)
+                        if self.build_log_scan:
+                            self.build_log_scan.feed(chunk)
+                    
+                if not self.verbose:
+                    os.remove(file)
+
+        if self.build_log_scan:
+            self.build_log_scan.close()
         
         if self.incremental:
             incremental_build_report_aggregator.parse_html_files(self.mpName)
@@ -339,7 +853,9 @@ class ParallelExecute(object):
         
         vcproj = VCProjectApi(self.manageProject)
 
-        if self.tc_order:
+        if self.lpt_order:
+            testcase_list_all = self.get_lpt_list(vcproj.Environment.all())
+        elif self.tc_order:
             testcase_list_all = self.get_testcase_list(vcproj.Environment.all())
         else:
             testcase_list_all = vcproj.Environment.all()
@@ -362,10 +878,7 @@ class ParallelExecute(object):
             self.parallel_exec_info[env.compiler.name] = (count, [])
 
         for env in testcase_list:
-            if env.system_tests: 
-                isSystemTest = True
-            else:
-                isSystemTest = False
+            resources = self.get_env_resources(env)
                 
             compiler = env.compiler.name
 
@@ -375,19 +888,25 @@ class ParallelExecute(object):
                         env_list = self.parallel_exec_info[compiler][1]
                         full_name = env.compiler.name + " " + env.testsuite.name + " " + env.name
                         if env.name in self.priority_list:
-                            env_list.insert(0,[full_name, isSystemTest])
+                            env_list.insert(0,[full_name, resources])
                         else:
-                            env_list.append([full_name, isSystemTest])
+                            env_list.append([full_name, resources])
                         self.waiting_execution_queue[compiler] = Queue()
         if self.verbose:
             pprint(self.parallel_exec_info)
 
+        job_names = []
+        slots = 0
         for entry in self.parallel_exec_info:
             count = self.parallel_exec_info[entry][0]
             for item in self.parallel_exec_info[entry][1]:
                 compiler, testsuite, env = item[0].split()
                 self.waiting_execution_queue[compiler].put(item)
+                job_names.append("/".join([compiler, testsuite, env]))
+            slots += min(count, len(self.parallel_exec_info[entry][1]))
                 
+        self.progress = ProgressReporter(job_names, slots, self.history, self.progress_file)
+        
         ## start threads that start threads
         self.compiler_exec_queue = Queue()
 
@@ -404,6 +923,8 @@ class ParallelExecute(object):
         
         self.monitor_jobs()
         
+        self.update_history()
+        
         self.cleanup()
         vcproj.close()
 
@@ -417,10 +938,15 @@ def parallel_build_execute(in_args):
         pe.doit()
     finally:
         sys.argv = prev_argv
+        
+    # build log phrase scan done while aggregating the logs
+    return pe.build_log_scan
 
 if __name__ == '__main__':
     print ("VectorCAST parallel_build_execute.py {} {}".format(VERSION, VERSION_DATE))
     pe = ParallelExecute()
     pe.parseParallelExecuteArgs()
     pe.doit()
+    if pe.aborted:
+        sys.exit(1)
 
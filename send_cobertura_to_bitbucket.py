@@ -1,10 +1,12 @@
-import requests
 import xml.etree.ElementTree as ET
 
 import shutil
 import os, sys, glob
+import itertools
 import json
+import gzip
 from vcast_utils import checkVectorCASTVersion, getVectorCASTEncoding
+import bitbucket_upload
 
 if not checkVectorCASTVersion(20, quiet = False):
     if __name__ != "__main__":
@@ -42,85 +44,184 @@ MEDIUM = 1
 HIGH = 2
 CRITICAL = 3
 
+def coverage_state(coverage):
+    """'full', 'none' or 'partial' for a "<percent>% (<covered>/<total>)" attribute, '' if missing"""
+    percent, sep, _ = coverage.partition("%")
+    if not sep:
+        return "partial" if coverage != '' else ''
+    if percent == "100.0":
+        return "full"
+    if percent == "0.0":
+        return "none"
+    return "partial"
+
+def line_severity(hits, branch, condition_state, functioncall_state, mcdcpair_state):
+    """(severity index, summary) for a line's coverage"""
+    summary = ""
+    severityCount = 0
 
-# Parse Cobertura XML
-def parse_cobertura(xml_path):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    annotations = []
-    for cls in root.findall(".//class"):
-        file_path = cls.attrib['filename']
-        for line in cls.findall("lines/line"):
-            num = int(line.attrib['number'])
-            hits = int(line.attrib['hits'])
-            branch = line.attrib.get('branch', 'false')
-            condition_coverage  = line.attrib.get('condition-coverage', '')
-            functioncall_coverage = line.attrib.get('functioncall-coverage', '')
-            mcdcpair_coverage = line.attrib.get('mcdcpair-coverage', '')
-
-            summary = ""
-            severityCount = 0
-
-            if hits == 0:
-                summary = "|{}No coverage".format(FAIL)
-                severityCount = CRITICAL
-                
+    if hits == 0:
+        summary = "|{}No coverage".format(FAIL)
+        severityCount = CRITICAL
+        
+    else:
+        summary = PASS + " ST" 
+        severityCount = LOW
+        if branch == 'true':
+            if condition_state == "full":
+                summary += "|BR{}".format(PASS)
+                severityCount -= 1
+            elif condition_state == "none":
+                summary += "|BR{}".format(FAIL)
+                severityCount += 1
             else:
-                summary = "|ST{}".format(FAIL)
-                summary = PASS + " ST" 
-                severityCount = LOW
-                if branch == 'true':
-                    if condition_coverage.startswith("100.0%"):
-                        #summary += " | {} BR: {}".format (PASS,condition_coverage)
-                        summary += "|BR{}".format(PASS)
-                        severityCount -= 1
-                    elif condition_coverage.startswith("0.0%"):
-                        #summary += " | {} BR: {}".format (FAIL,condition_coverage)
-                        summary += "|BR{}".format(FAIL)
-                        severityCount += 1
-                    else:
-                        #summary += " | {} BR: {}".format (PARTIAL,condition_coverage)
-                        summary += "|BR{}".format(PARTIAL)
-                        severityCount += 1
-
-                if functioncall_coverage.startswith("100.0%"):
-                    #summary += " | {} FC".format (PASS)
-                    summary += " |FCC{}".format (PASS)
-                    severityCount -= 1
-                elif functioncall_coverage != '':
-                    #summary += " | {} FC".format (FAIL)
-                    summary += " |FCC{}".format (FAIL)
-                    severityCount += 1
-                    
-                if mcdcpair_coverage.startswith("100.0%"):
-                    #summary += " | {} MCDC: {}".format (PASS, mcdcpair_coverage)
-                    summary += " |MCDC{}".format (PASS)
-                    severityCount -= 1
-                elif mcdcpair_coverage.startswith("0.0%"):
-                    #summary += " | {} MCDC: {}".format (FAIL, mcdcpair_coverage)
-                    summary += " |MCDC{}".format (FAIL)
-                    severityCount += 1
-                elif mcdcpair_coverage != '':
-                    #summary += " | {} MCDC: {}".format (PARTIAL, mcdcpair_coverage)
-                    summary += " |MCDC{}".format (PARTIAL)
-                    severityCount += 1
-                    
-            if severityCount > CRITICAL: severityCount = CRITICAL
-            if severityCount < LOW: severityCount = LOW
+                summary += "|BR{}".format(PARTIAL)
+                severityCount += 1
+
+        if functioncall_state == "full":
+            summary += " |FCC{}".format (PASS)
+            severityCount -= 1
+        elif functioncall_state != '':
+            summary += " |FCC{}".format (FAIL)
+            severityCount += 1
             
-            annotations.append({
-                "title": "Coverage",
-                "annotation_type": "COVERAGE",
-                "summary": summary,
-                "severity": severityArray[severityCount],
-                "path": file_path,
-                "line": num,
-                "external_id": "{}#{}".format(file_path,num)
-                }
-            )
+        if mcdcpair_state == "full":
+            summary += " |MCDC{}".format (PASS)
+            severityCount -= 1
+        elif mcdcpair_state == "none":
+            summary += " |MCDC{}".format (FAIL)
+            severityCount += 1
+        elif mcdcpair_state != '':
+            summary += " |MCDC{}".format (PARTIAL)
+            severityCount += 1
             
+    if severityCount > CRITICAL: severityCount = CRITICAL
+    if severityCount < LOW: severityCount = LOW
+
+    return severityCount, summary
+
+def make_annotation(file_path, num, severityCount, summary):
+    return {
+        "title": "Coverage",
+        "annotation_type": "COVERAGE",
+        "summary": summary,
+        "severity": severityArray[severityCount],
+        "path": file_path,
+        "line": num,
+        "external_id": "{}#{}".format(file_path,num)
+        }
+
+def iter_cobertura_lines(xml_path):
+    """
+    Streams (filename, line attributes) for the <lines><line> entries of every
+    <class>, dropping each class from memory once it has been read
+    """
+    tags = []
+    file_path = None
+    for event, elem in ET.iterparse(xml_path, events=("start", "end")):
+        if event == "start":
+            tags.append(elem.tag)
+            if elem.tag == "class":
+                file_path = elem.attrib['filename']
+            continue
+
+        tags.pop()
+        if elem.tag == "line" and len(tags) >= 2 and tags[-1] == "lines" and tags[-2] == "class":
+            yield file_path, elem.attrib
+        elif elem.tag in ("class", "package"):
+            elem.clear()
+
+def parse_cobertura_files(xml_path):
+    """
+    Reads the Cobertura XML in one streaming pass.
+
+    Returns the annotations of every line in the order they appear in the XML
+    and a per-file summary {path: {"lines", "covered", "severity"}}.
+    """
+    # the same handful of attribute combinations repeat on nearly every line
+    severities = {}
+    annotations = []
+    files = {}
+
+    for file_path, attrib in iter_cobertura_lines(xml_path):
+        hits = int(attrib['hits'])
+        key = (
+            hits == 0,
+            attrib.get('branch', 'false'),
+            coverage_state(attrib.get('condition-coverage', '')),
+            coverage_state(attrib.get('functioncall-coverage', '')),
+            coverage_state(attrib.get('mcdcpair-coverage', ''))
+        )
+        try:
+            severityCount, summary = severities[key]
+        except KeyError:
+            severityCount, summary = severities[key] = line_severity(hits, *key[1:])
+
+        file_summary = files.get(file_path, None)
+        if file_summary is None:
+            file_summary = files[file_path] = {"lines" : 0, "covered" : 0, "severity" : LOW}
+        file_summary["lines"] += 1
+        if hits:
+            file_summary["covered"] += 1
+        if severityCount > file_summary["severity"]:
+            file_summary["severity"] = severityCount
+
+        annotations.append(make_annotation(file_path, int(attrib['number']), severityCount, summary))
+
+    for file_summary in files.values():
+        file_summary["severity"] = severityArray[file_summary["severity"]]
+
+    return annotations, files
+
+# Parse Cobertura XML
+def parse_cobertura(xml_path):
+    annotations, files = parse_cobertura_files(xml_path)
     return annotations
 
+def merge_cobertura_results(results):
+    """
+    Combines the parse_cobertura_files results of several XML files: all the
+    annotations, in file then line order, and the file summaries
+    """
+    all_annotations = []
+    file_summaries = {}
+    for annotations, files in results:
+        all_annotations.extend(annotations)
+        for path, summary in files.items():
+            merged = file_summaries.get(path, None)
+            if merged is None:
+                file_summaries[path] = dict(summary)
+                continue
+            merged["lines"] += summary["lines"]
+            merged["covered"] += summary["covered"]
+            if severityArray.index(summary["severity"]) > severityArray.index(merged["severity"]):
+                merged["severity"] = summary["severity"]
+
+    return all_annotations, file_summaries
+
+def parse_cobertura_many(xml_paths, jobs = 1):
+    """parse_cobertura_files for several XML files, parsed in parallel when jobs > 1"""
+    work = list(xml_paths)
+
+    results = None
+    if jobs > 1 and len(work) > 1:
+        import multiprocessing
+        try:
+            pool = multiprocessing.Pool(min(jobs, len(work)))
+        except (OSError, ImportError, NotImplementedError) as e:
+            print("  Unable to parse the coverage files in parallel ({})...parsing serially".format(e))
+        else:
+            try:
+                results = pool.map(parse_cobertura_files, work)
+            finally:
+                pool.close()
+                pool.join()
+
+    if results is None:
+        results = [parse_cobertura_files(xml_path) for xml_path in work]
+
+    return merge_cobertura_results(results)
+
 def get_summary_string(type_str, rate):
     
     if rate == -1:
@@ -175,58 +276,91 @@ def get_summary_resuts(xml_path, minimum_passing_coverage, verbose):
         
     return data, timestamp, version, overall_coverage
     
+def make_metrics_annotation(fname, summary, serverity):
+    return {
+        "title": "Metrics Report",
+        "annotation_type": "COVERAGE",
+        "summary": summary,
+        "severity": serverity,
+        "path": fname,
+        "external_id": "{}#{}".format(fname,"FILE_METRIC"),
+        "line" : 0
+        }
+
 # Send annotations in batches of 100
-def send_metrics_annotations(annotationData, workspace, repo_slug, commit_hash, email, token, verbose):
+def send_metrics_annotations(annotationData, workspace, repo_slug, commit_hash, email, token, verbose, session = None, jobs = bitbucket_upload.UPLOAD_JOBS):
 
     print("Sending metrics annotations")
 
     # CONFIGURATION
     report_id = "metrics-report"
 
-    url = "https://api.bitbucket.org/2.0/repositories/{}/{}/commit/{}/reports/{}/annotations".format(workspace, repo_slug, commit_hash, report_id)
+    url = bitbucket_upload.report_url(workspace, repo_slug, commit_hash, report_id) + "/annotations"
 
-    headers = {"Accept": "application/json", "Content-Type": "application/json"},
+    # built as the upload batches need them
+    annotations = (make_metrics_annotation(fname, summary, serverity) for fname, summary, serverity in annotationData)
 
-    annotations = []
-    
-    for fname, summary, serverity  in annotationData:
-        annotations.append({
-            "title": "Metrics Report",
-            "annotation_type": "COVERAGE",
-            "summary": summary,
-            "severity": serverity,
-            "path": fname,
-            "external_id": "{}#{}".format(fname,"FILE_METRIC"),
-            "line" : 0
-            }
-        )
+    if verbose:
+        first = list(itertools.islice(annotations, 10))
+        print(json.dumps(first[1:10]))
+        annotations = itertools.chain(first, annotations)
 
-    for i in range(0, len(annotations), 100):
-        batch = annotations[i:i+100]     
-                                          
-        if verbose:
-            print(json.dumps(annotations[1:10]))
-
-        resp = requests.post(
-            url, 
-            auth=(email, token), 
-            json=batch, 
-            headers= {"Accept": "application/json", "Content-Type": "application/json"}
-        )
-        
-        if resp.status_code != 200 and not verbose:
-            print("Batch {} response: {} {}".format(i//100+1,resp.status_code, resp.text))
-            
-        elif resp.status_code != 200 or verbose:
-            print("Batch {} response: {} {}".format(i//100+1,resp.status_code, resp.text))
-            
-        else:
-            print("Batch {} response: {}".format(i//100+1,resp.status_code))
-            
+    if session is None:
+        session = bitbucket_upload.make_session(email, token, jobs)
+
+    results = bitbucket_upload.upload_annotations(session, url, annotations, jobs = jobs, verbose = verbose)
 
     print("Complete")
 
-def saveDataForSending(summary, annotationData, link, verbose):
+    return results
+
+# annotation data is saved one JSON array per line: [fname, summary, severity]
+ANNOTATION_DATA_NAME = "metrics_annotation_data.bb_jsonl"
+LEGACY_ANNOTATION_DATA_NAME = "metrics_annotation_data.bb_txt"
+
+def annotationDataFiles(savePath):
+    """Saved annotation data files, in the order they are looked for"""
+    return [
+        os.path.join(savePath, ANNOTATION_DATA_NAME + ".gz"),
+        os.path.join(savePath, ANNOTATION_DATA_NAME),
+        os.path.join(savePath, LEGACY_ANNOTATION_DATA_NAME),
+    ]
+
+def writeAnnotationData(savePath, annotationData, compress = True):
+    gzName, plainName, legacyName = annotationDataFiles(savePath)
+    fname = gzName if compress else plainName
+
+    # don't leave another format behind to be read instead
+    for other in (gzName, plainName, legacyName):
+        if other != fname and os.path.exists(other):
+            os.remove(other)
+
+    opener = gzip.open if compress else open
+    with opener(fname, "wb") as fd:
+        for row in annotationData:
+            fd.write((json.dumps(list(row), ensure_ascii=False) + "\n").encode(encFmt, "replace"))
+
+def iterAnnotationData(savePath):
+    """Streams the saved annotation data rows without loading the whole file"""
+    gzName, plainName, legacyName = annotationDataFiles(savePath)
+
+    if os.path.exists(legacyName) and not os.path.exists(gzName) and not os.path.exists(plainName):
+        with open(legacyName, "rb") as fd:
+            for row in json.loads(fd.read().decode(encFmt, "replace")):
+                yield row
+        return
+
+    if os.path.exists(gzName):
+        fd = gzip.open(gzName, "rb")
+    else:
+        fd = open(plainName, "rb")
+    with fd:
+        for line in fd:
+            line = line.decode(encFmt, "replace").strip()
+            if line:
+                yield json.loads(line)
+
+def saveDataForSending(summary, annotationData, link, verbose, compress = True):
     
     savePath = os.path.join(os.environ['BITBUCKET_CLONE_DIR'],"saved-metrics-data" )
 
@@ -237,16 +371,14 @@ def saveDataForSending(summary, annotationData, link, verbose):
     with open(fname, "wb") as fd:
         fd.write(summary.encode(encFmt,'replace'))
         
-    fname = os.path.join(savePath,"metrics_annotation_data.bb_txt")
-    with open(fname, "wb") as fd:
-        saveData = json.dumps(annotationData, ensure_ascii=False).encode(encFmt, "replace")
-        fd.write(saveData)
+    writeAnnotationData(savePath, annotationData, compress)
         
     fname = os.path.join(savePath,"metrics_link.bb_txt")
     with open(fname, "wb") as fd:
         fd.write(link.encode(encFmt,'replace'))
         
 def readSavedData(verbose = False):
+    """summary, annotation data rows (read lazily) and link saved by saveDataForSending"""
     
     savePath = os.path.join(os.environ['BITBUCKET_CLONE_DIR'],"saved-metrics-data" )
     
@@ -254,11 +386,7 @@ def readSavedData(verbose = False):
     with open(fname, "rb") as fd:
         summary = fd.read().decode(encFmt, 'replace')
         
-    fname = os.path.join(savePath,"metrics_annotation_data.bb_txt")        
-    with open(fname, "rb") as fd:
-        raw = fd.read()
-        rawAsText= raw.decode(encFmt, "replace")
-        annotationData = json.loads(rawAsText)
+    annotationData = iterAnnotationData(savePath)
 
     fname = os.path.join(savePath,"metrics_link.bb_txt")        
     with open(fname, "rb") as fd:
@@ -266,7 +394,7 @@ def readSavedData(verbose = False):
         
     return summary, annotationData, link
         
-def sendMetricsReport(verbose):
+def sendMetricsReport(verbose, jobs = bitbucket_upload.UPLOAD_JOBS):
 
     bitbucket_workspace   = os.environ['BITBUCKET_WORKSPACE']
     bitbucket_repo_slug   = os.environ['BITBUCKET_REPO_SLUG']
@@ -282,15 +410,13 @@ def sendMetricsReport(verbose):
     # CONFIGURATION
     report_id = "metrics-report"
 
-    url = "https://api.bitbucket.org/2.0/repositories/{}/{}/commit/{}/reports/{}".format(
+    url = bitbucket_upload.report_url(
         bitbucket_workspace, 
         bitbucket_repo_slug, 
         bitbucket_commit_hash, 
         report_id
     )
 
-    headers = {"Accept": "application/json", "Content-Type": "application/json"}
-    
     report_payload = {
         "title": "Metrics Report",
         "details": summary,
@@ -311,24 +437,35 @@ def sendMetricsReport(verbose):
         "Content-Type": "application/json; charset=" + encFmt
     }
 
-    resp = requests.put(
+    # one pooled session for the report and all of its annotations
+    session = bitbucket_upload.make_session(bitbucket_email, bitbucket_api_token, jobs)
+
+    resp, attempts = bitbucket_upload.send_with_retry(
+        session,
+        "PUT",
         url,
-        auth=(bitbucket_email, bitbucket_api_token),
         data=sendData,
-        headers=headers,
-        timeout=30
+        headers=headers
     )
 
     if resp.status_code == 200:
-        send_metrics_annotations(
+        results = send_metrics_annotations(
             annotationData, 
             bitbucket_workspace, 
             bitbucket_repo_slug, 
             bitbucket_commit_hash, 
             bitbucket_email, 
             bitbucket_api_token, 
-            verbose
+            verbose,
+            session = session,
+            jobs = jobs
         )
+
+        # a partial upload must not look like a success to CI
+        failed = [result for result in results if not result.ok]
+        if failed:
+            print("Metrics annotations - FAILED: {} of {} batches could not be sent".format(len(failed), len(results)))
+            sys.exit(1)
                         
     else:
         print("Metrics Reported Creation - FAILED")
@@ -336,16 +473,20 @@ def sendMetricsReport(verbose):
         print("Response:", resp.text)
 
     
-def buildCoverageData(mpName, filename, minimum_passing_coverage, verbose):
+def buildCoverageData(mpName, filename, minimum_passing_coverage, verbose, jobs = 1, compress = True):
 
-    annotations = parse_cobertura(filename)
+    filenames = [filename] if isinstance(filename, str) else filename
+    annotations, file_summaries = parse_cobertura_many(filenames, jobs = jobs)
     
     with open("coverage_results.json", "wb") as fd:
         fd.write(json.dumps(annotations, indent=2).encode(encFmt,'replace'))
         
+    with open("coverage_file_summaries.json", "wb") as fd:
+        fd.write(json.dumps(file_summaries, indent=2, sort_keys=True).encode(encFmt,'replace'))
+        
     summary, annotation_data, link = generate_metrics_md(mpName)
 
-    saveDataForSending(summary, annotation_data, link, verbose)
+    saveDataForSending(summary, annotation_data, link, verbose, compress)
       
 def cleanup(dirName, fname = ""):
 
@@ -394,7 +535,7 @@ def moveFiles(html_base_dir, verbose = False):
                 print("Error copying {} --> {}\n{}".format(html, dest, e))
 
      
-def run(fullMP, minimum_passing_coverage, useCi, html_base_dir, source_root, generate_data, send_data, verbose):
+def run(fullMP, minimum_passing_coverage, useCi, html_base_dir, source_root, generate_data, send_data, verbose, jobs = bitbucket_upload.UPLOAD_JOBS, compress = True):
     
     if not checkVectorCASTVersion(21):
         print("Cannot create Cobertura metrics to send to BitBucket. Please upgrade VectorCAST")
@@ -446,14 +587,22 @@ def run(fullMP, minimum_passing_coverage, useCi, html_base_dir, source_root, gen
             os.rename(fname, new_name)
             fname = new_name
 
-        print("\nProcessing {} and sending to BitBucket: ".format(fname))
+        # any other coverage_results_*.xml files are reported along with it
+        fnames = [fname] + sorted(
+            f for f in glob.glob(os.path.join("coverage","cobertura","coverage_results_*.xml"))
+            if os.path.abspath(f) != os.path.abspath(fname)
+        )
+
+        print("\nProcessing {} and sending to BitBucket: ".format(", ".join(fnames)))
 
         if generate_data:
             buildCoverageData(
                 fullMP,
-                filename = fname,
+                filename = fnames,
                 minimum_passing_coverage = minimum_passing_coverage,
-                verbose = verbose
+                verbose = verbose,
+                jobs = jobs,
+                compress = compress
             )
             moveFiles(
                 html_base_dir = html_base_dir,
@@ -462,7 +611,7 @@ def run(fullMP, minimum_passing_coverage, useCi, html_base_dir, source_root, gen
 
         else:
             
-            sendMetricsReport(verbose)
+            sendMetricsReport(verbose, jobs)
 
 
     
@@ -525,6 +674,20 @@ if __name__ == "__main__":
         default = ""
     )
 
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        help="Number of coverage files to parse or annotation batches to send at the same time (default {})".format(bitbucket_upload.UPLOAD_JOBS),
+        default=bitbucket_upload.UPLOAD_JOBS
+    )
+
+    parser.add_argument(
+        "--no_compress_data",
+        action="store_true",
+        help="Save the generated annotation data uncompressed",
+        default=False
+    )
+
     args = parser.parse_args()
 
     if args.ci:
@@ -546,6 +709,8 @@ if __name__ == "__main__":
         source_root = args.source_root,
         generate_data = args.generate_data,
         send_data = args.send_data,
-        verbose = args.verbose
+        verbose = args.verbose,
+        jobs = args.jobs,
+        compress = not args.no_compress_data
     )
     
\ No newline at end of file
@@ -0,0 +1,78 @@
+#
+# The MIT License
+#
+# Copyright 2026 Vector Informatik, GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+# sqlite_paths.py - path normalization for the cover/master database tools
+#
+# Paths are normalized once per row by a SQL function and kept in indexed temp
+# tables, so matching is done by SQLite instead of in Python dictionaries and
+# memory use does not grow with the size of the database.
+
+import os
+import sqlite3
+
+# distinct paths remembered per SQL function - the cache is dropped when full
+PATH_CACHE_SIZE = 4096
+
+def normalize_path(path, case_sensitive):
+    """Normalize slash style and redundant path components for comparison."""
+    normalized = os.path.normpath(path.replace("\\", "/")).replace("\\", "/")
+    return normalized if case_sensitive else normalized.casefold()
+
+def cached(func, size = PATH_CACHE_SIZE):
+    """Memoize func with a bounded cache"""
+    cache = {}
+    def lookup(*args):
+        try:
+            return cache[args]
+        except KeyError:
+            if len(cache) >= size:
+                cache.clear()
+            value = cache[args] = func(*args)
+            return value
+    return lookup
+
+def register_path_function(conn, name, nargs, func, size = PATH_CACHE_SIZE):
+    """Make func available to SQL on conn as name(...)"""
+    func = cached(func, size)
+    try:
+        conn.create_function(name, nargs, func, deterministic=True)
+    except (TypeError, sqlite3.NotSupportedError):
+        # python < 3.8 or SQLite < 3.8.3
+        conn.create_function(name, nargs, func)
+
+def create_temp_table(conn, name, select, index = "match_path"):
+    """
+    Store the rows of select in the temp table name, indexed on index.
+
+    Temp tables keep their rowid in the order select returned the rows, so
+    ORDER BY <index>, rowid gives the rows grouped by path in their original
+    order.
+    """
+    conn.execute("DROP TABLE IF EXISTS temp.%s" % name)
+    conn.execute("CREATE TEMP TABLE %s AS %s" % (name, select))
+    conn.execute("CREATE INDEX temp.%s_index ON %s (%s)" % (name, name, index))
+
+def drop_temp_tables(conn, names):
+    for name in names:
+        conn.execute("DROP TABLE IF EXISTS temp.%s" % name)
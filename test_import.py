@@ -46,6 +46,8 @@ except:
     pass
 
 try:
+    import bitbucket_upload
+    import build_archive
     import cobertura
     import copy_build_dir
     import create_index_html
@@ -67,7 +69,9 @@ try:
     import managewait
     import merge_vcr
     import patch_rgw_directory
+    import pclp_messages
     import safe_open
+    import sqlite_paths
     import tee_print
     import vcast_exec
     import vcast_utils
@@ -30,11 +30,20 @@ import os
 import shutil
 import sqlite3
 import sys
+import tempfile
 from contextlib import closing
-from collections import defaultdict
 from dataclasses import dataclass
+from itertools import groupby
+from operator import itemgetter
 from pathlib import Path
-from typing import DefaultDict, Iterable
+from typing import Iterable, Iterator
+
+from sqlite_paths import (
+    create_temp_table,
+    drop_temp_tables,
+    normalize_path,
+    register_path_function,
+)
 
 
 @dataclass(frozen=True)
@@ -69,12 +78,6 @@ class PlannedUpdate:
     new_build_md5sum: str | None
 
 
-def normalize_path(path: str, *, case_sensitive: bool) -> str:
-    """Normalize slash style and redundant path components for comparison."""
-    normalized = os.path.normpath(path.replace("\\", "/")).replace("\\", "/")
-    return normalized if case_sensitive else normalized.casefold()
-
-
 def quote_identifier(name: str) -> str:
     """Quote a validated SQLite identifier."""
     return '"' + name.replace('"', '""') + '"'
@@ -112,36 +115,36 @@ def validate_schema(connection: sqlite3.Connection, path_column: str) -> None:
             )
 
 
-def load_source_files(
-    connection: sqlite3.Connection,
-    *,
-    path_column: str,
-    case_sensitive: bool,
-) -> dict[str, list[SourceFile]]:
-    grouped: DefaultDict[str, list[SourceFile]] = defaultdict(list)
-    column = quote_identifier(path_column)
+# temp tables plan_updates creates on R1's connection
+PLAN_TABLES = (
+    "r1_sources",
+    "r2_sources",
+    "r1_projects",
+    "r1_project_matches",
+    "plan_candidates",
+    "r1_project_files",
+)
 
-    query = f"SELECT id, {column} AS match_path, checksum FROM source_files"
-    for row in connection.execute(query):
-        source_id = int(row["id"])
-        source_path = row["match_path"]
 
-        if source_path is None or not str(source_path).strip():
-            key = f"<missing-path:id={source_id}>"
-            display_path = "<NULL>" if source_path is None else str(source_path)
-        else:
-            display_path = str(source_path)
-            key = normalize_path(display_path, case_sensitive=case_sensitive)
-
-        grouped[key].append(
-            SourceFile(
-                id=source_id,
-                path=display_path,
-                checksum=row["checksum"],
-            )
-        )
+def source_key(source_id: int, source_path, *, case_sensitive: bool) -> str:
+    if source_path is None or not str(source_path).strip():
+        return f"<missing-path:id={int(source_id)}>"
+    return normalize_path(str(source_path), case_sensitive=case_sensitive)
+
+
+def project_key(project_path, *, case_sensitive: bool) -> str | None:
+    if project_path is None or not str(project_path).strip():
+        return None
+    return normalize_path(str(project_path), case_sensitive=case_sensitive)
 
-    return dict(grouped)
+
+def make_source_file(row: sqlite3.Row) -> SourceFile:
+    source_path = row["source_path"]
+    return SourceFile(
+        id=int(row["id"]),
+        path="<NULL>" if source_path is None else str(source_path),
+        checksum=row["checksum"],
+    )
 
 
 def checksum_set(rows: Iterable[SourceFile]) -> set[int | None]:
@@ -152,82 +155,175 @@ def format_source_rows(rows: list[SourceFile]) -> str:
     return ", ".join(f"id={row.id}, checksum={row.checksum}" for row in rows)
 
 
-def load_projects_by_path(
-    connection: sqlite3.Connection,
-    *,
-    case_sensitive: bool,
-) -> dict[str, list[sqlite3.Row]]:
-    projects: DefaultDict[str, list[sqlite3.Row]] = defaultdict(list)
+def database_file(connection: sqlite3.Connection) -> str | None:
+    """Return the file behind a connection's main database, if any."""
+    for row in connection.execute("PRAGMA database_list"):
+        if row[1] == "main":
+            return row[2] or None
+    return None
+
 
-    for row in connection.execute("SELECT id, name, path FROM projects"):
-        project_path = row["path"]
-        if project_path is None or not str(project_path).strip():
-            continue
+def attach_r2(r1: sqlite3.Connection, r2: sqlite3.Connection) -> str | None:
+    """Attach R2 to R1's connection as r2.
 
-        key = normalize_path(str(project_path), case_sensitive=case_sensitive)
-        projects[key].append(row)
+    An R2 without a database file is copied to a temp file first; the name
+    of that copy is returned so it can be removed afterwards.
+    """
+    r2_file = database_file(r2)
+    r2_copy = None
+    if r2_file is None:
+        fd, r2_copy = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        with closing(sqlite3.connect(r2_copy)) as target:
+            r2.backup(target)
+        r2_file = r2_copy
 
-    return dict(projects)
+    r1.execute("ATTACH DATABASE ? AS r2", (r2_file,))
+    return r2_copy
 
 
-def load_project_files_for_source(
+def create_source_table(
     connection: sqlite3.Connection,
-    source_file_id: int,
-) -> list[ProjectFileMetadata]:
-    query = """
-        SELECT
-            pf.id AS project_file_id,
-            pf.project_id,
-            p.name AS project_name,
-            p.path AS project_path,
-            pf.source_file_id,
-            pf.timestamp,
-            pf.build_md5sum
-        FROM project_files AS pf
-        JOIN projects AS p
-          ON p.id = pf.project_id
-        WHERE pf.source_file_id = ?
-        ORDER BY p.path, pf.id
+    name: str,
+    schema: str,
+    *,
+    path_column: str,
+) -> None:
+    column = quote_identifier(path_column)
+    create_temp_table(
+        connection,
+        name,
+        f"""
+        SELECT id, {column} AS source_path, checksum,
+               source_key(id, {column}) AS match_path
+        FROM {schema}.source_files
+        """,
+    )
+
+
+def iter_source_groups(
+    cursor: sqlite3.Cursor, name: str
+) -> Iterator[tuple[str, list[SourceFile]]]:
+    """Yield (key, rows) for every normalized source path, in key order."""
+    query = f"""
+        SELECT id, source_path, checksum, match_path
+        FROM temp.{name}
+        ORDER BY match_path, rowid
+    """
+    for key, rows in groupby(cursor.execute(query), key=itemgetter("match_path")):
+        yield key, [make_source_file(row) for row in rows]
+
+
+def duplicate_source_groups(
+    connection: sqlite3.Connection, name: str
+) -> Iterator[list[SourceFile]]:
+    """Yield the rows of every duplicated source path, by first occurrence."""
+    query = f"""
+        SELECT match_path
+        FROM temp.{name}
+        GROUP BY match_path
+        HAVING COUNT(*) > 1
+        ORDER BY MIN(rowid)
     """
+    for (key,) in connection.execute(query).fetchall():
+        rows = connection.execute(
+            f"""
+            SELECT id, source_path, checksum
+            FROM temp.{name}
+            WHERE match_path = ?
+            ORDER BY rowid
+            """,
+            (key,),
+        )
+        yield [make_source_file(row) for row in rows]
+
+
+def join_source_groups(
+    r1_groups: Iterator[tuple[str, list[SourceFile]]],
+    r2_groups: Iterator[tuple[str, list[SourceFile]]],
+) -> Iterator[tuple[list[SourceFile] | None, list[SourceFile] | None]]:
+    """Merge two key-ordered group streams into (R1 rows, R2 rows) pairs."""
+    r1_group = next(r1_groups, None)
+    r2_group = next(r2_groups, None)
+
+    while r1_group is not None or r2_group is not None:
+        if r2_group is None or (r1_group is not None and r1_group[0] < r2_group[0]):
+            yield r1_group[1], None
+            r1_group = next(r1_groups, None)
+        elif r1_group is None or r2_group[0] < r1_group[0]:
+            yield None, r2_group[1]
+            r2_group = next(r2_groups, None)
+        else:
+            yield r1_group[1], r2_group[1]
+            r1_group = next(r1_groups, None)
+            r2_group = next(r2_groups, None)
 
-    rows: list[ProjectFileMetadata] = []
-    for row in connection.execute(query, (source_file_id,)):
-        project_path = row["project_path"]
-        if project_path is None:
-            continue
-
-        rows.append(
-            ProjectFileMetadata(
-                project_file_id=int(row["project_file_id"]),
-                project_id=int(row["project_id"]),
-                project_name=row["project_name"],
-                project_path=str(project_path),
-                source_file_id=int(row["source_file_id"]),
-                timestamp=row["timestamp"],
-                build_md5sum=row["build_md5sum"],
-            )
+
+def create_candidate_table(
+    connection: sqlite3.Connection,
+    candidates: list[tuple[SourceFile, SourceFile]],
+) -> None:
+    connection.execute("DROP TABLE IF EXISTS temp.plan_candidates")
+    connection.execute(
+        """
+        CREATE TEMP TABLE plan_candidates (
+            seq INTEGER PRIMARY KEY,
+            r1_source_file_id INTEGER NOT NULL,
+            r2_source_file_id INTEGER NOT NULL
         )
+        """
+    )
+    connection.executemany(
+        "INSERT INTO temp.plan_candidates VALUES (?, ?, ?)",
+        (
+            (seq, r1_source.id, r2_source.id)
+            for seq, (r1_source, r2_source) in enumerate(candidates)
+        ),
+    )
 
-    return rows
+
+# every R2 project_files row of the candidate sources with its R1 project and
+# R1 project_files matches
+CANDIDATE_QUERY = """
+    SELECT
+        c.seq,
+        pf.rowid AS pf_rowid,
+        pf.id AS project_file_id,
+        pf.project_id,
+        p.name AS project_name,
+        p.path AS project_path,
+        pf.source_file_id,
+        pf.timestamp,
+        pf.build_md5sum,
+        m.matches AS r1_matches,
+        m.id AS r1_project_id,
+        r1pf.rowid AS r1_rowid,
+        r1pf.id AS r1_project_file_id,
+        r1pf.timestamp AS r1_timestamp,
+        r1pf.build_md5sum AS r1_build_md5sum
+    FROM temp.plan_candidates AS c
+    JOIN r2.project_files AS pf
+      ON pf.source_file_id = c.r2_source_file_id
+    JOIN r2.projects AS p
+      ON p.id = pf.project_id
+    LEFT JOIN temp.r1_project_matches AS m
+      ON m.match_path = project_key(p.path)
+    LEFT JOIN temp.r1_project_files AS r1pf
+      ON m.matches = 1
+     AND r1pf.project_id = m.id
+     AND r1pf.source_file_id = c.r1_source_file_id
+    WHERE p.path IS NOT NULL
+    ORDER BY c.seq, p.path, pf.id, pf.rowid, r1pf.rowid
+"""
 
 
 def find_r1_project_file(
-    connection: sqlite3.Connection,
+    rows: list[sqlite3.Row],
     *,
     r1_project_id: int,
     r1_source_file_id: int,
 ) -> sqlite3.Row | None:
-    rows = list(
-        connection.execute(
-            """
-            SELECT id, timestamp, build_md5sum
-            FROM project_files
-            WHERE project_id = ?
-              AND source_file_id = ?
-            """,
-            (r1_project_id, r1_source_file_id),
-        )
-    )
+    rows = [row for row in rows if row["r1_rowid"] is not None]
 
     if len(rows) > 1:
         raise ValueError(
@@ -244,6 +340,7 @@ def plan_updates(
     *,
     path_column: str,
     case_sensitive: bool,
+    include_unchanged: bool = False,
 ) -> tuple[
     list[PlannedUpdate],
     list[str],
@@ -251,116 +348,210 @@ def plan_updates(
     list[str],
     list[str],
 ]:
-    r1_sources = load_source_files(
-        r1, path_column=path_column, case_sensitive=case_sensitive
+    # Paths are normalized once per row into indexed temp tables on R1's
+    # connection and matched there, so memory does not grow with the
+    # number of rows in either database.
+    register_path_function(
+        r1,
+        "source_key",
+        2,
+        lambda source_id, source_path: source_key(
+            source_id, source_path, case_sensitive=case_sensitive
+        ),
     )
-    r2_sources = load_source_files(
-        r2, path_column=path_column, case_sensitive=case_sensitive
+    register_path_function(
+        r1,
+        "project_key",
+        1,
+        lambda project_path: project_key(
+            project_path, case_sensitive=case_sensitive
+        ),
     )
-    r1_projects = load_projects_by_path(r1, case_sensitive=case_sensitive)
+    r2_copy = attach_r2(r1, r2)
+    # open statements would keep the temp tables locked - close them at the end
+    r1_cursor, r2_cursor, candidate_cursor = r1.cursor(), r1.cursor(), r1.cursor()
 
-    duplicate_source_paths: list[str] = []
-    for key, rows in r1_sources.items():
-        if len(rows) > 1:
-            duplicate_source_paths.append(
-                f"R1 duplicate source path {rows[0].path}: {format_source_rows(rows)}"
-            )
-    for key, rows in r2_sources.items():
-        if len(rows) > 1:
-            duplicate_source_paths.append(
-                f"R2 duplicate source path {rows[0].path}: {format_source_rows(rows)}"
+    try:
+        create_source_table(r1, "r1_sources", "main", path_column=path_column)
+        create_source_table(r1, "r2_sources", "r2", path_column=path_column)
+        create_temp_table(
+            r1,
+            "r1_projects",
+            """
+            SELECT *
+            FROM (
+                SELECT id, name, path, project_key(path) AS match_path
+                FROM main.projects
             )
+            WHERE match_path IS NOT NULL
+            """,
+        )
+        create_temp_table(
+            r1,
+            "r1_project_matches",
+            """
+            SELECT match_path, COUNT(*) AS matches, id
+            FROM temp.r1_projects
+            GROUP BY match_path
+            """,
+        )
 
-    duplicate_project_paths = [
-        rows[0]["path"]
-        for rows in r1_projects.values()
-        if len(rows) > 1
-    ]
-
-    changed_paths: list[str] = []
-    skipped: list[str] = []
-    plans: list[PlannedUpdate] = []
-
-    common_keys = sorted(set(r1_sources) & set(r2_sources))
-    for key in common_keys:
-        if checksum_set(r1_sources[key]) == checksum_set(r2_sources[key]):
-            continue
+        duplicate_source_paths = [
+            f"R1 duplicate source path {rows[0].path}: {format_source_rows(rows)}"
+            for rows in duplicate_source_groups(r1, "r1_sources")
+        ]
+        duplicate_source_paths.extend(
+            f"R2 duplicate source path {rows[0].path}: {format_source_rows(rows)}"
+            for rows in duplicate_source_groups(r1, "r2_sources")
+        )
 
-        changed_paths.append(r1_sources[key][0].path)
+        duplicate_project_paths = [
+            row["path"]
+            for row in r1.execute(
+                """
+                SELECT path, MIN(rowid)
+                FROM temp.r1_projects
+                GROUP BY match_path
+                HAVING COUNT(*) > 1
+                ORDER BY MIN(rowid)
+                """
+            )
+        ]
+
+        changed: list[tuple[list[SourceFile], list[SourceFile]]] = []
+        only_r1: list[str] = []
+        only_r2: list[str] = []
+        for r1_rows, r2_rows in join_source_groups(
+            iter_source_groups(r1_cursor, "r1_sources"),
+            iter_source_groups(r2_cursor, "r2_sources"),
+        ):
+            if r2_rows is None:
+                only_r1.append(r1_rows[0].path)
+            elif r1_rows is None:
+                only_r2.append(r2_rows[0].path)
+            elif checksum_set(r1_rows) != checksum_set(r2_rows):
+                changed.append((r1_rows, r2_rows))
 
         # Ambiguous source paths are unsafe to update automatically.
-        if len(r1_sources[key]) != 1 or len(r2_sources[key]) != 1:
-            skipped.append(
-                f"Skipped {r1_sources[key][0].path}: duplicate source path"
+        candidates = [
+            (r1_rows[0], r2_rows[0])
+            for r1_rows, r2_rows in changed
+            if len(r1_rows) == 1 and len(r2_rows) == 1
+        ]
+        create_candidate_table(r1, candidates)
+        create_temp_table(
+            r1,
+            "r1_project_files",
+            """
+            SELECT id, project_id, source_file_id, timestamp, build_md5sum
+            FROM main.project_files
+            WHERE source_file_id IN (
+                SELECT r1_source_file_id FROM temp.plan_candidates
             )
-            continue
+            """,
+            index="project_id, source_file_id",
+        )
 
-        r1_source = r1_sources[key][0]
-        r2_source = r2_sources[key][0]
+        changed_paths: list[str] = []
+        skipped: list[str] = []
+        plans: list[PlannedUpdate] = []
 
-        for r2_pf in load_project_files_for_source(r2, r2_source.id):
-            project_key = normalize_path(
-                r2_pf.project_path, case_sensitive=case_sensitive
-            )
-            matching_projects = r1_projects.get(project_key, [])
+        candidate_groups = groupby(
+            candidate_cursor.execute(CANDIDATE_QUERY), key=itemgetter("seq")
+        )
+        candidate_group = next(candidate_groups, None)
+        seq = 0
 
-            if not matching_projects:
-                skipped.append(
-                    f"Skipped project {r2_pf.project_path!r} for "
-                    f"{r2_source.path}: no matching R1 project path"
-                )
-                continue
+        for r1_rows, r2_rows in changed:
+            changed_paths.append(r1_rows[0].path)
 
-            if len(matching_projects) > 1:
+            if len(r1_rows) != 1 or len(r2_rows) != 1:
                 skipped.append(
-                    f"Skipped project {r2_pf.project_path!r} for "
-                    f"{r2_source.path}: duplicate R1 project path"
+                    f"Skipped {r1_rows[0].path}: duplicate source path"
                 )
                 continue
 
-            r1_project = matching_projects[0]
-            r1_pf = find_r1_project_file(
-                r1,
-                r1_project_id=int(r1_project["id"]),
-                r1_source_file_id=r1_source.id,
-            )
-
-            if r1_pf is None:
-                skipped.append(
-                    f"Skipped project {r2_pf.project_path!r} for "
-                    f"{r2_source.path}: no matching R1 project_files row"
+            r1_source = r1_rows[0]
+            r2_source = r2_rows[0]
+
+            has_rows = candidate_group is not None and candidate_group[0] == seq
+            matches: Iterable[sqlite3.Row] = candidate_group[1] if has_rows else []
+            seq += 1
+
+            for _, pf_rows in groupby(matches, key=itemgetter("pf_rowid")):
+                pf_rows = list(pf_rows)
+                row = pf_rows[0]
+                r2_pf = ProjectFileMetadata(
+                    project_file_id=int(row["project_file_id"]),
+                    project_id=int(row["project_id"]),
+                    project_name=row["project_name"],
+                    project_path=str(row["project_path"]),
+                    source_file_id=int(row["source_file_id"]),
+                    timestamp=row["timestamp"],
+                    build_md5sum=row["build_md5sum"],
                 )
-                continue
-
-            if (
-                r1_pf["timestamp"] == r2_pf.timestamp
-                and r1_pf["build_md5sum"] == r2_pf.build_md5sum
-            ):
-                continue
 
-            plans.append(
-                PlannedUpdate(
-                    source_path=r1_source.path,
-                    project_path=r2_pf.project_path,
-                    project_name=r2_pf.project_name,
-                    r1_project_file_id=int(r1_pf["id"]),
+                if row["r1_matches"] is None:
+                    skipped.append(
+                        f"Skipped project {r2_pf.project_path!r} for "
+                        f"{r2_source.path}: no matching R1 project path"
+                    )
+                    continue
+
+                if row["r1_matches"] > 1:
+                    skipped.append(
+                        f"Skipped project {r2_pf.project_path!r} for "
+                        f"{r2_source.path}: duplicate R1 project path"
+                    )
+                    continue
+
+                r1_pf = find_r1_project_file(
+                    pf_rows,
+                    r1_project_id=int(row["r1_project_id"]),
                     r1_source_file_id=r1_source.id,
-                    r2_source_file_id=r2_source.id,
-                    old_timestamp=r1_pf["timestamp"],
-                    new_timestamp=r2_pf.timestamp,
-                    old_build_md5sum=r1_pf["build_md5sum"],
-                    new_build_md5sum=r2_pf.build_md5sum,
                 )
-            )
 
-    only_r1 = [
-        r1_sources[key][0].path
-        for key in sorted(set(r1_sources) - set(r2_sources))
-    ]
-    only_r2 = [
-        r2_sources[key][0].path
-        for key in sorted(set(r2_sources) - set(r1_sources))
-    ]
+                if r1_pf is None:
+                    skipped.append(
+                        f"Skipped project {r2_pf.project_path!r} for "
+                        f"{r2_source.path}: no matching R1 project_files row"
+                    )
+                    continue
+
+                if (
+                    not include_unchanged
+                    and r1_pf["r1_timestamp"] == r2_pf.timestamp
+                    and r1_pf["r1_build_md5sum"] == r2_pf.build_md5sum
+                ):
+                    continue
+
+                plans.append(
+                    PlannedUpdate(
+                        source_path=r1_source.path,
+                        project_path=r2_pf.project_path,
+                        project_name=r2_pf.project_name,
+                        r1_project_file_id=int(r1_pf["r1_project_file_id"]),
+                        r1_source_file_id=r1_source.id,
+                        r2_source_file_id=r2_source.id,
+                        old_timestamp=r1_pf["r1_timestamp"],
+                        new_timestamp=r2_pf.timestamp,
+                        old_build_md5sum=r1_pf["r1_build_md5sum"],
+                        new_build_md5sum=r2_pf.build_md5sum,
+                    )
+                )
+
+            if has_rows:
+                candidate_group = next(candidate_groups, None)
+
+    finally:
+        for cursor in (r1_cursor, r2_cursor, candidate_cursor):
+            cursor.close()
+        # The temp table inserts open a transaction, which blocks DETACH.
+        drop_temp_tables(r1, PLAN_TABLES)
+        r1.commit()
+        r1.execute("DETACH DATABASE r2")
+        if r2_copy is not None:
+            os.remove(r2_copy)
 
     warnings = duplicate_source_paths[:]
     warnings.extend(
@@ -370,6 +561,26 @@ def plan_updates(
     return plans, changed_paths, skipped, only_r1, only_r2 + warnings
 
 
+def combine_plans(plan_lists: list[list[PlannedUpdate]]) -> list[PlannedUpdate]:
+    """Combine plans made against the same R1 from several R2 databases.
+
+    The plans must be made with include_unchanged=True.  They give the same
+    result as applying each R2 to R1 in turn: the last R2 to touch a
+    project_files row wins, and rows that end up unchanged are dropped.
+    """
+    final: dict[int, PlannedUpdate] = {}
+    for plans in plan_lists:
+        for plan in plans:
+            final[plan.r1_project_file_id] = plan
+
+    return [
+        plan
+        for plan in final.values()
+        if plan.old_timestamp != plan.new_timestamp
+        or plan.old_build_md5sum != plan.new_build_md5sum
+    ]
+
+
 def create_backup(database: Path, requested_path: Path | None) -> Path:
     backup = (
         requested_path
@@ -385,39 +596,40 @@ def create_backup(database: Path, requested_path: Path | None) -> Path:
 
 
 def apply_updates(database: Path, plans: list[PlannedUpdate]) -> int:
-    updated = 0
-
     with closing(sqlite3.connect(database)) as connection:
         connection.execute("PRAGMA foreign_keys = ON")
         connection.execute("BEGIN IMMEDIATE")
 
-        for plan in plans:
-            cursor = connection.execute(
-                """
-                UPDATE project_files
-                SET timestamp = ?,
-                    build_md5sum = ?
-                WHERE id = ?
-                  AND (
-                        timestamp IS NOT ?
-                     OR build_md5sum IS NOT ?
-                  )
-                """,
+        cursor = connection.executemany(
+            """
+            UPDATE project_files
+            SET timestamp = ?,
+                build_md5sum = ?
+            WHERE id = ?
+              AND (
+                    timestamp IS NOT ?
+                 OR build_md5sum IS NOT ?
+              )
+            """,
+            (
                 (
                     plan.new_timestamp,
                     plan.new_build_md5sum,
                     plan.r1_project_file_id,
                     plan.new_timestamp,
                     plan.new_build_md5sum,
-                ),
-            )
-
-            if cursor.rowcount != 1:
-                raise RuntimeError(
-                    "Expected to update exactly one project_files row, but "
-                    f"updated {cursor.rowcount} for id={plan.r1_project_file_id}"
                 )
-            updated += 1
+                for plan in plans
+            ),
+        )
+
+        # Every plan must change exactly one row; otherwise roll back.
+        if cursor.rowcount != len(plans):
+            raise RuntimeError(
+                f"Expected to update {len(plans)} project_files row(s), but "
+                f"updated {cursor.rowcount}"
+            )
+        updated = cursor.rowcount
 
         integrity = connection.execute("PRAGMA integrity_check").fetchone()[0]
         if integrity != "ok":
@@ -239,6 +239,9 @@ class VectorCASTExecute(object):
         else:
             self.build_log_name = self.mpName + "_build.log"
 
+        # phrase scan of the build log if already done while building
+        self.build_log_scan = None
+
         self.manageWait = ManageWait(
             verbose = self.verbose,
             command_line = "",
@@ -468,13 +471,14 @@ class VectorCASTExecute(object):
             os.makedirs(os.path.join(self.xml_data_dir,"pclp"))
             report_name = os.path.join(self.xml_data_dir,"pclp","gl-code-quality-report.json")
             print("PC-lint Plus Metrics file: " + report_name)
-            generate_pclp_reports.generate_reports(self.pclp_input, output_gitlab = report_name)
-
             if self.pclp_output_html:
                 print("Creating PC-lint Plus Findings")
-                generate_pclp_reports.generate_html_report(self.FullMP, self.pclp_input, self.pclp_output_html)
                 self.needIndexHtml = True
 
+            # one parse of the PC-lint Plus XML for both reports
+            generate_pclp_reports.generate_reports(self.pclp_input, output_gitlab = report_name,
+                output_html = self.pclp_output_html, full_mp_name = self.FullMP)
+
     def runReports(self):
         if self.aggregate:
             agg_rpt_name = self.mpName + "_aggregate_report.html"
@@ -613,7 +617,9 @@ class VectorCASTExecute(object):
 
             callStr = " ".join(callList)
             print("Build/Execute in parallel using {}".format(" ".join(callList)))
-            parallel_build_execute.parallel_build_execute(callStr)
+            build_log_scan = parallel_build_execute.parallel_build_execute(callStr)
+            if hasattr(build_log_scan, "report"):
+                self.build_log_scan = build_log_scan
 
         else:
             if useParallelManageCommand:
@@ -649,7 +655,11 @@ class VectorCASTExecute(object):
                 msgs.append(f"{complexityFailureCount} complexity failures")
 
         if args.check_build_log:
-            if check_build_log(self.build_log_name) == 2:
+            if self.build_log_scan is not None:
+                build_log_status = self.build_log_scan.report()
+            else:
+                build_log_status = check_build_log(self.build_log_name)
+            if build_log_status == 2:
                 msgs.append(f"Build log error. See information above...")
 
         if self.useJunitFailCountPct:
@@ -120,6 +120,15 @@ def getVectorCASTEncoding():
         
     return enc;
     
+def replaceFile(src, dst):
+    try:
+        os.replace(src, dst)
+    except AttributeError:
+        # python 2 - rename won't overwrite on Windows
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
 def printVectorLogo():
     print( "                                                                                  ####                             ")
     print( "                                                                                  ########                         ")